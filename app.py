@@ -1,9 +1,18 @@
-import gradio as gr
 import os
 import json
+import time
+import hashlib
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import as_completed
 from paper_summarizer import PaperSummarizer
+from job_store import JobStore, write_json_atomic
+from scheduler import FairScheduler
+from usage import UsageTracker, load_price_table, format_usage_line
+from structured import SummaryStore, render_markdown
+from blob_store import BlobStore
+
+# gradio 仅在 create_interface 中延迟导入，配置读写等操作无需加载整个Web框架
 
 
 class PaperSummarizerApp:
@@ -17,6 +26,48 @@ class PaperSummarizerApp:
         Path("summaries").mkdir(exist_ok=True)
         self.load_config()
 
+        # WORKER_MODE=queue 时，任务提交到共享队列，由独立的 worker.py 进程处理
+        self.job_store = JobStore("data") if os.getenv('WORKER_MODE', 'local') == 'queue' else None
+        self.queue_poll_interval = float(os.getenv('QUEUE_POLL_INTERVAL', '1.0'))
+        # 批次在 QUEUE_TIMEOUT 秒内没有任何进展（例如没有worker在运行）时，剩余任务标记为失败
+        self.queue_timeout = float(os.getenv('QUEUE_TIMEOUT', '900'))
+        if self.job_store:
+            # 批次结果读取后即删除；这里清理app崩溃时遗留的任务（超过 JOB_MAX_AGE_HOURS 小时）
+            # 和超过 CACHE_MAX_AGE_DAYS 天的总结缓存
+            removed_jobs, removed_cache = self.job_store.prune(
+                float(os.getenv('JOB_MAX_AGE_HOURS', '24')) * 3600,
+                float(os.getenv('CACHE_MAX_AGE_DAYS', '30')) * 86400
+            )
+            if removed_jobs or removed_cache:
+                print(f"🧹 已清理 {removed_jobs} 个过期的队列任务，{removed_cache} 条过期的总结缓存")
+
+        # 每批次的预算（可选）：BUDGET_MAX_TOKENS / BUDGET_MAX_COST（美元），
+        # 用量达到80%后切换到 BUDGET_FALLBACK_MODEL，达到100%后停止处理剩余论文
+        self.budget_max_tokens = int(os.getenv('BUDGET_MAX_TOKENS', '0')) or None
+        self.budget_max_cost = float(os.getenv('BUDGET_MAX_COST', '0')) or None
+        self.budget_fallback_model = os.getenv('BUDGET_FALLBACK_MODEL') or None
+        self.price_table = load_price_table(os.getenv('PRICE_TABLE'))
+        self.usage_log_file = "data/usage.jsonl"
+
+        # 结构化模式下的总结存储，便于批量查询（python structured.py --where ...）
+        self.summary_store = SummaryStore("data/summaries.jsonl")
+
+        # 上传文件的内容寻址存储：重复上传只保存一份，超过 BLOB_MAX_AGE_DAYS 天未使用的文件启动时清理
+        self.blob_store = BlobStore("data/blobs")
+        removed = self.blob_store.prune(float(os.getenv('BLOB_MAX_AGE_DAYS', '7')) * 86400)
+        if removed:
+            print(f"🧹 已清理 {removed} 个过期的上传文件")
+
+        # OCR_FALLBACK=1 时扫描版PDF使用本地OCR（需要服务器安装tesseract）
+        self.ocr_fallback = os.getenv('OCR_FALLBACK', '0') == '1'
+
+        # 本地模式下所有用户共享的公平调度器：SCHEDULER_WORKERS 为并发API调用总数，
+        # MAX_IN_FLIGHT_PER_USER 为单个用户占用的线程数上限（无人排队时可超出，但始终留一个空闲线程给新用户）
+        self.scheduler = FairScheduler(
+            max_workers=int(os.getenv('SCHEDULER_WORKERS', '4')),
+            max_in_flight_per_user=int(os.getenv('MAX_IN_FLIGHT_PER_USER', '2'))
+        )
+
     def load_config(self):
         """加载配置文件"""
         if os.path.exists(self.config_file) and os.path.getsize(self.config_file) > 0:
@@ -53,8 +104,8 @@ class PaperSummarizerApp:
                 'model': model,
                 'prompt': prompt
             }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            # 多个app进程可能同时保存配置，使用原子写入
+            write_json_atomic(self.config_file, config)
             return "✅ 配置已保存"
         except Exception as e:
             return f"❌ 保存失败: {str(e)}"
@@ -66,7 +117,8 @@ class PaperSummarizerApp:
         result = self.save_config(provider, api_key, base_url or '', model, prompt or '')
         return result
 
-    def process_papers(self, files, provider, api_key, base_url, model, custom_prompt, save_config_flag, progress=gr.Progress()):
+    def process_papers(self, files, provider, api_key, base_url, model, custom_prompt, save_config_flag,
+                       skip_references=False, structured=False, progress=None, user_key=None):
         """
         处理上传的PDF文件
 
@@ -78,11 +130,17 @@ class PaperSummarizerApp:
             model: 模型名称
             custom_prompt: 自定义prompt
             save_config_flag: 是否保存配置
-            progress: Gradio进度条对象
+            skip_references: 是否跳过参考文献和附录页
+            structured: 是否使用结构化JSON输出
+            progress: Gradio进度条对象（为None时不报告进度）
+            user_key: 公平调度使用的用户标识（默认按API密钥区分）
 
         Returns:
             markdown内容和状态消息
         """
+        if progress is None:
+            progress = lambda *args, **kwargs: None
+
         try:
             # 验证输入
             if not files:
@@ -95,62 +153,57 @@ class PaperSummarizerApp:
             if save_config_flag:
                 self.save_config(provider, api_key, base_url or '', model, custom_prompt or '')
 
-            # 创建总结器
-            summarizer = PaperSummarizer(
-                api_key=api_key,
-                base_url=base_url if base_url else None,
-                model=model
-            )
-
-            # 处理每个文件
-            summaries = []
             total_files = len(files)
 
             print(f"\n{'='*70}")
             print(f"📚 开始批量处理论文，共 {total_files} 篇")
             print(f"{'='*70}\n")
 
-            for i, file in enumerate(files, 1):
-                # 更新进度条
-                progress_value = (i - 1) / total_files
-                file_name = Path(file.name).name
-                progress(progress_value, desc=f"📄 正在处理 ({i}/{total_files}): {file_name[:30]}...")
-
-                try:
-                    file_path = file.name
-                    print(f"\n{'='*70}")
-                    print(f"📄 [{i}/{total_files}] 正在处理: {file_name}")
-                    print(f"{'='*70}")
-
-                    summary_data = summarizer.summarize_paper(
-                        file_path,
-                        custom_prompt if custom_prompt else None
-                    )
+            # 上传文件在到达时只哈希一次并存入内容寻址存储，批次内内容相同的文件只处理一次
+            uploads = [(Path(file.name).name, self.blob_store.put(file.name)) for file in files]
+            papers = {}
+            for file_name, content_hash in uploads:
+                papers.setdefault(content_hash, {
+                    "file_name": file_name,
+                    "file_path": str(self.blob_store.path_for(content_hash)),
+                    "content_hash": content_hash
+                })
+            papers = list(papers.values())
+            if len(papers) < total_files:
+                print(f"♻️ 检测到 {total_files - len(papers)} 个重复文件，相同内容只处理一次")
+
+            usage_tracker = UsageTracker(
+                price_table=self.price_table,
+                max_tokens=self.budget_max_tokens,
+                max_cost=self.budget_max_cost,
+                fallback_model=self.budget_fallback_model
+            )
 
-                    # 验证总结内容
-                    if not summary_data.get('summary') or len(summary_data['summary'].strip()) < 50:
-                        raise Exception("生成的总结内容为空或太短")
-
-                    summaries.append(summary_data)
-                    success_count = sum(1 for s in summaries if not s['summary'].startswith('❌'))
-                    print(f"\n✅ {file_name} 处理成功！")
-                    print(f"📊 进度: 已完成 {i}/{total_files} 篇 (成功: {success_count}, 失败: {i - success_count})")
-
-                except Exception as e:
-                    error_msg = f"❌ 处理失败: {str(e)}"
-                    print(f"\n{error_msg}")
-                    print(f"文件路径: {file.name}")
-                    summaries.append({
-                        "file_name": Path(file.name).name,
-                        "summary": error_msg,
-                        "file_path": file.name
-                    })
-                    success_count = sum(1 for s in summaries if not s['summary'].startswith('❌'))
-                    print(f"📊 进度: 已完成 {i}/{total_files} 篇 (成功: {success_count}, 失败: {i - success_count})")
+            if self.job_store:
+                results = self._process_via_queue(papers, api_key, base_url, model, custom_prompt,
+                                                  skip_references, structured, progress, usage_tracker)
+            else:
+                results = self._process_locally(papers, api_key, base_url, model, custom_prompt,
+                                                  skip_references, structured, progress,
+                                                  user_key or self._user_key_from_api_key(api_key),
+                                                  usage_tracker)
 
             # 完成进度
             progress(1.0, desc="✅ 处理完成！")
 
+            # 保存结构化总结（每个不同内容保存一次），记录实际使用的模型（可能因预算降级）
+            for summary_data in results:
+                if summary_data.get('structured'):
+                    used_model = (summary_data.get('usage') or {}).get('model') or model
+                    self.summary_store.append(summary_data['file_name'], used_model, summary_data['structured'])
+
+            # 按上传顺序展开结果，重复文件共用同一份总结
+            results_by_hash = {paper['content_hash']: result for paper, result in zip(papers, results)}
+            summaries = [
+                dict(results_by_hash[content_hash], file_name=file_name)
+                for file_name, content_hash in uploads
+            ]
+
             # 统计处理结果
             success_count = sum(1 for s in summaries if not s['summary'].startswith('❌'))
             fail_count = total_files - success_count
@@ -161,22 +214,191 @@ class PaperSummarizerApp:
             print(f"{'='*70}\n")
 
             # 生成Markdown内容
-            markdown_content = self.generate_markdown(summaries)
+            markdown_content = self.generate_markdown(summaries, usage_tracker)
 
             # 保存到文件
-            output_file = f"summaries/summaries_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+            # 文件名附带进程号，避免多个app进程在同一秒写入同名文件
+            output_file = f"summaries/summaries_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.md"
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(markdown_content)
 
+            # 记录本批次的用量指标
+            usage_tracker.write_log(self.usage_log_file, {'output_file': output_file, 'papers': total_files})
+            totals = usage_tracker.totals()
+            print(usage_tracker.format_markdown())
+
             status_msg = f"✅ 成功处理 {len(summaries)} 篇论文\n📄 结果已保存到: {output_file}"
+            status_msg += f"\n📊 Token用量: {totals['total_tokens']}"
+            if totals['cost'] is not None:
+                status_msg += f"，约 ${totals['cost']:.4f}"
 
             return markdown_content, output_file, status_msg
 
         except Exception as e:
             return "", None, f"❌ 错误: {str(e)}"
 
-    def generate_markdown(self, summaries):
-        """生成Markdown格式的总结"""
+    def _process_locally(self, papers, api_key, base_url, model, custom_prompt, skip_references, structured, progress,
+                         user_key, usage_tracker):
+        """
+        在当前进程中处理去重后的论文
+
+        每个文件作为独立任务提交到公平调度器，多个用户的请求按轮询交错执行，
+        结果按 papers 的顺序返回。
+        """
+        # 创建总结器
+        summarizer = PaperSummarizer(
+            api_key=api_key,
+            base_url=base_url if base_url else None,
+            model=model,
+            skip_references=skip_references,
+            ocr_fallback=self.ocr_fallback,
+            usage_tracker=usage_tracker,
+            structured=structured
+        )
+
+        total_files = len(papers)
+        futures = [
+            self.scheduler.submit(user_key, self._summarize_one, summarizer, paper['file_path'], paper['file_name'],
+                                  custom_prompt)
+            for paper in papers
+        ]
+
+        # 按完成顺序更新进度
+        done_count = 0
+        for _ in as_completed(futures):
+            done_count += 1
+            progress(done_count / total_files, desc=f"📄 已完成 {done_count}/{total_files} 篇")
+
+        summaries = [future.result() for future in futures]
+        success_count = sum(1 for s in summaries if not s['summary'].startswith('❌'))
+        print(f"📊 进度: 已完成 {total_files}/{total_files} 篇 (成功: {success_count}, 失败: {total_files - success_count})")
+        return summaries
+
+    def _summarize_one(self, summarizer, file_path, file_name, custom_prompt):
+        """处理单个文件，失败时返回错误信息而不是抛出异常"""
+        try:
+            print(f"\n{'='*70}")
+            print(f"📄 正在处理: {file_name}")
+            print(f"{'='*70}")
+
+            summary_data = summarizer.summarize_paper(
+                file_path,
+                custom_prompt if custom_prompt else None,
+                file_name
+            )
+
+            # 验证总结内容
+            if not summary_data.get('summary') or len(summary_data['summary'].strip()) < 50:
+                raise Exception("生成的总结内容为空或太短")
+
+            print(f"\n✅ {file_name} 处理成功！")
+            return summary_data
+
+        except Exception as e:
+            error_msg = f"❌ 处理失败: {str(e)}"
+            print(f"\n{error_msg}")
+            print(f"文件路径: {file_path}")
+            return {
+                "file_name": file_name,
+                "summary": error_msg,
+                "file_path": file_path
+            }
+
+    @staticmethod
+    def _user_key_from_api_key(api_key):
+        """没有会话信息时，用API密钥摘要区分用户（不在内存中保留明文密钥）"""
+        return "key-" + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+    def _process_via_queue(self, papers, api_key, base_url, model, custom_prompt, skip_references, structured,
+                           progress, usage_tracker):
+        """
+        将文件提交到共享任务队列，由 worker 进程处理，并等待整个批次完成
+
+        worker上报的用量会汇总到 usage_tracker（队列模式只统计，不执行预算限制）
+
+        Returns:
+            与 _process_locally 相同格式的总结列表
+        """
+        settings = {
+            'api_key': api_key,
+            'base_url': base_url or '',
+            'model': model,
+            'prompt': custom_prompt or '',
+            'skip_references': bool(skip_references),
+            'structured': bool(structured)
+        }
+        batch_id = self.job_store.enqueue_batch(papers, settings)
+        total_files = len(papers)
+        print(f"📮 已提交批次 {batch_id}，等待worker处理...")
+
+        try:
+            last_state = None
+            last_progress = time.time()
+            while True:
+                jobs = self.job_store.batch_jobs(batch_id)
+                finished = sum(1 for job in jobs if job['status'] in (JobStore.DONE, JobStore.FAILED))
+                progress(finished / total_files, desc=f"📄 已完成 {finished}/{total_files} 篇")
+                if finished == total_files:
+                    break
+
+                # 有任务被领取、完成或worker更新心跳即视为有进展
+                state = [(job['status'], job['heartbeat_at']) for job in jobs]
+                if state != last_state:
+                    last_state = state
+                    last_progress = time.time()
+                elif time.time() - last_progress > self.queue_timeout:
+                    failed = self.job_store.fail_unfinished(
+                        batch_id, f"等待超时：{self.queue_timeout:.0f} 秒内没有进展，请检查worker是否在运行")
+                    print(f"⏰ 批次 {batch_id} 等待超时，{failed} 个任务标记为失败")
+                    jobs = self.job_store.batch_jobs(batch_id)
+                    break
+                time.sleep(self.queue_poll_interval)
+        finally:
+            # 结果已读入内存，删除队列中的任务行
+            self.job_store.delete_batch(batch_id)
+
+        summaries = []
+        for paper, job in zip(papers, jobs):
+            structured_data = None
+            if job['status'] == JobStore.DONE:
+                summary = job['summary']
+                if structured:
+                    # 结构化模式下worker返回JSON，在这里渲染为Markdown
+                    structured_data = json.loads(summary)
+                    summary = render_markdown(structured_data)
+            else:
+                summary = f"❌ 处理失败: {job['error']}"
+
+            usage = json.loads(job['usage']) if job.get('usage') else None
+            if usage:
+                usage = usage_tracker.record(usage['model'], usage['prompt_tokens'], usage['completion_tokens'],
+                                             usage.get('elapsed', 0.0), job['file_name'])
+
+            summaries.append({
+                "file_name": job['file_name'],
+                "summary": summary,
+                "file_path": paper['file_path'],
+                "usage": usage,
+                "structured": structured_data
+            })
+        return summaries
+
+    def get_metrics(self):
+        """运行指标（供压测工具通过隐藏的 /metrics 接口读取）"""
+        import threading
+
+        metrics = {
+            'pid': os.getpid(),
+            'rss_mb': _current_rss_mb(),
+            'threads': threading.active_count(),
+            'scheduler': self.scheduler.stats(),
+        }
+        if self.job_store:
+            metrics['queue'] = self.job_store.queue_stats()
+        return metrics
+
+    def generate_markdown(self, summaries, usage_tracker=None):
+        """生成Markdown格式的总结（提供 usage_tracker 时附带用量统计）"""
         md_content = "# 📚 论文总结合集\n\n"
         md_content += f"**生成时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
         md_content += f"**论文数量**: {len(summaries)}\n\n"
@@ -184,9 +406,13 @@ class PaperSummarizerApp:
 
         for i, summary_data in enumerate(summaries, 1):
             md_content += f"## 📄 {i}. {summary_data['file_name']}\n\n"
+            md_content += format_usage_line(summary_data.get('usage'))
             md_content += f"{summary_data['summary']}\n\n"
             md_content += "---\n\n"
 
+        if usage_tracker:
+            md_content += usage_tracker.format_markdown()
+
         return md_content
 
     def get_default_prompt(self):
@@ -265,6 +491,17 @@ class PaperSummarizerApp:
 
     def create_interface(self):
         """创建Gradio界面"""
+        import gradio as gr
+
+        # Gradio通过默认参数中的 gr.Progress() 注入进度条，因此在这里包装一层
+        # 同时注入 gr.Request，按浏览器会话区分用户进行公平调度
+        def process_papers_with_progress(files, provider, api_key, base_url, model, custom_prompt,
+                                         save_config_flag, skip_references, structured, request: gr.Request,
+                                         progress=gr.Progress()):
+            session_hash = getattr(request, 'session_hash', None)
+            return self.process_papers(files, provider, api_key, base_url, model, custom_prompt,
+                                       save_config_flag, skip_references, structured, progress,
+                                       user_key=f"session-{session_hash}" if session_hash else None)
 
         # 自定义CSS
         custom_css = """
@@ -353,6 +590,16 @@ class PaperSummarizerApp:
                         file_types=[".pdf"]
                     )
 
+                    skip_references_input = gr.Checkbox(
+                        label="跳过参考文献和附录（减少解析时间和token消耗）",
+                        value=False
+                    )
+
+                    structured_input = gr.Checkbox(
+                        label="结构化输出（按固定字段输出JSON并校验，结果同时保存到 data/summaries.jsonl）",
+                        value=False
+                    )
+
                     process_btn = gr.Button("🚀 开始总结", variant="primary", size="lg")
 
                     status_output = gr.Textbox(
@@ -404,7 +651,7 @@ class PaperSummarizerApp:
 
             # 绑定处理函数
             process_btn.click(
-                fn=self.process_papers,
+                fn=process_papers_with_progress,
                 inputs=[
                     file_input,
                     provider_dropdown,
@@ -412,11 +659,28 @@ class PaperSummarizerApp:
                     base_url_input,
                     model_input,
                     custom_prompt_input,
-                    save_config
+                    save_config,
+                    skip_references_input,
+                    structured_input
                 ],
-                outputs=[markdown_output, download_file, status_output]
+                outputs=[markdown_output, download_file, status_output],
+                # 不在Gradio层面串行化请求，并发由 FairScheduler 按用户控制
+                concurrency_limit=None,
+                api_name="process_papers"
             )
 
+            # 隐藏的监控接口，供 scripts/load_test.py 采样调度器和内存指标。
+            # 接口没有鉴权，只在设置 LOAD_TEST_METRICS=1 时注册
+            if os.getenv('LOAD_TEST_METRICS', '0') == '1':
+                metrics_output = gr.JSON(visible=False)
+                metrics_btn = gr.Button(visible=False)
+                metrics_btn.click(
+                    fn=self.get_metrics,
+                    outputs=[metrics_output],
+                    concurrency_limit=None,
+                    api_name="metrics"
+                )
+
             # 添加说明
             gr.Markdown(
                 """
@@ -444,6 +708,18 @@ class PaperSummarizerApp:
         return app
 
 
+def _current_rss_mb():
+    """当前进程的常驻内存（MB），非Linux系统返回None"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
 def main():
     """启动应用"""
     app_instance = PaperSummarizerApp()
@@ -456,7 +732,7 @@ def main():
         share=False,
         show_error=True,
         # 增加连接稳定性配置
-        max_threads=10,  # 最大并发线程
+        max_threads=int(os.getenv('GRADIO_MAX_THREADS', '10')),  # 最大并发线程
         quiet=False,  # 显示日志便于调试
         show_api=False,  # 不显示API文档
         # 允许跨域（如果需要通过反向代理访问）
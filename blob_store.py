@@ -0,0 +1,94 @@
+import os
+import mmap
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+
+@contextmanager
+def mapped_file(path: str):
+    """
+    以只读mmap方式打开文件
+
+    PyPDF2.PdfReader 和 base64.b64encode 都可以直接使用mmap对象，
+    避免把整个PDF再读入一份Python bytes。空文件无法mmap，直接抛出异常。
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise Exception("文件为空（0字节），请检查上传的PDF是否完整")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的SHA-256（通过mmap一次性读取，空文件也可以计算）"""
+    if os.path.getsize(path) == 0:
+        return hashlib.sha256(b'').hexdigest()
+    with mapped_file(path) as data:
+        return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    按内容寻址的PDF存储（data/blobs/<哈希前2位>/<哈希>.pdf）
+
+    相同内容的上传只保存一份：同一批次内的重复文件和之前批次上传过的文件都不会再次写盘。
+    存入时优先使用硬链接，同一文件系统内不复制数据。
+    """
+
+    def __init__(self, root: str = "data/blobs"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        """内容哈希对应的文件路径"""
+        return self.root / digest[:2] / f"{digest}.pdf"
+
+    def put(self, path: str) -> str:
+        """
+        存入文件
+
+        Args:
+            path: 上传的临时文件路径
+
+        Returns:
+            内容哈希
+        """
+        digest = hash_file(path)
+        blob_path = self.path_for(digest)
+
+        if blob_path.exists():
+            # 已存在：只更新时间戳，供 prune 判断是否仍在使用
+            os.utime(blob_path)
+            return digest
+
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = blob_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            # 跨文件系统（例如 /tmp 与 Docker 卷）时无法硬链接，退回复制
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, blob_path)
+        return digest
+
+    def prune(self, max_age: float) -> int:
+        """
+        删除超过 max_age 秒未被使用的文件
+
+        Returns:
+            删除的文件数
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        for blob_path in self.root.glob("*/*.pdf"):
+            try:
+                if blob_path.stat().st_mtime < cutoff:
+                    blob_path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
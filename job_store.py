@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import List, Dict, Optional
+
+
+class JobStore:
+    """
+    多进程共享的任务队列、结果存储和总结缓存
+
+    基于 data/ 目录下的 SQLite 数据库（WAL模式），由 SQLite 自身的文件锁
+    保证多个 app / worker 进程（同一主机或挂载同一卷的多个容器）之间的互斥。
+    """
+
+    # 任务状态
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, data_dir: str = "data"):
+        """
+        初始化任务存储
+
+        Args:
+            data_dir: 数据目录（Docker卷挂载点），数据库存放在这里
+        """
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.data_dir / "jobs.db")
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每次操作使用独立连接，避免跨线程共享连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def _init_db(self):
+        """创建数据表"""
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    batch_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    content_hash TEXT,
+                    settings TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    summary TEXT,
+                    error TEXT,
+                    usage TEXT,
+                    worker_id TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+                CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, seq);
+                CREATE TABLE IF NOT EXISTS summary_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            # 兼容旧版本创建的数据库
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (('usage', 'TEXT'), ('content_hash', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def cache_key(content_hash: str, model: str, prompt: Optional[str], options: Optional[Dict] = None) -> str:
+        """根据PDF内容哈希、模型、prompt和处理选项计算缓存键"""
+        digest = hashlib.sha256(content_hash.encode('utf-8'))
+        digest.update(b'\0' + model.encode('utf-8'))
+        digest.update(b'\0' + (prompt or '').encode('utf-8'))
+        digest.update(b'\0' + json.dumps(options or {}, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def enqueue_batch(self, papers: List[Dict], settings: Dict) -> str:
+        """
+        提交一批任务
+
+        文件需已存入共享数据卷中的内容寻址存储（BlobStore），其他容器中的worker直接读取，无需复制。
+
+        Args:
+            papers: 论文列表，每项包含 file_name、file_path、content_hash
+            settings: 总结器配置（api_key、base_url、model、prompt），api_key 在任务结束时清除
+
+        Returns:
+            批次ID
+        """
+        batch_id = uuid.uuid4().hex
+        settings_json = json.dumps(settings, ensure_ascii=False)
+
+        now = time.time()
+        rows = [
+            (uuid.uuid4().hex, batch_id, seq, paper['file_name'], str(paper['file_path']), paper['content_hash'],
+             settings_json, self.PENDING, now)
+            for seq, paper in enumerate(papers)
+        ]
+
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT INTO jobs (id, batch_id, seq, file_name, file_path, content_hash, settings, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        finally:
+            conn.close()
+
+        return batch_id
+
+    def claim_next(self, worker_id: str) -> Optional[Dict]:
+        """
+        原子地领取下一个待处理任务（按批次公平轮转）
+
+        Args:
+            worker_id: 领取任务的worker标识
+
+        Returns:
+            任务字典，没有待处理任务时返回None
+        """
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE 立即获取写锁，避免两个worker领取同一任务
+            conn.execute("BEGIN IMMEDIATE")
+            # 优先领取正在运行任务最少的批次，避免大批量上传独占所有worker
+            row = conn.execute(
+                "SELECT j.* FROM jobs j "
+                "LEFT JOIN (SELECT batch_id, COUNT(*) AS running FROM jobs WHERE status = ? GROUP BY batch_id) r "
+                "ON r.batch_id = j.batch_id "
+                "WHERE j.status = ? ORDER BY COALESCE(r.running, 0), j.created_at, j.seq LIMIT 1",
+                (self.RUNNING, self.PENDING)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (self.RUNNING, worker_id, now, now, row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        job = dict(row)
+        job['settings'] = json.loads(job['settings'])
+        return job
+
+    def complete(self, job_id: str, summary: str, usage: Optional[Dict] = None):
+        """标记任务成功（usage 为本次API调用的token用量，命中缓存时为None）"""
+        self._finish(job_id, self.DONE, summary=summary, usage=usage)
+
+    def fail(self, job_id: str, error: str):
+        """标记任务失败"""
+        self._finish(job_id, self.FAILED, error=error)
+
+    def _finish(self, job_id: str, status: str, summary: str = None, error: str = None, usage: Dict = None):
+        conn = self._connect()
+        try:
+            # 任务结束后立即从共享数据库中删除明文API密钥
+            conn.execute(
+                "UPDATE jobs SET status = ?, summary = ?, error = ?, usage = ?, finished_at = ?, "
+                "settings = json_remove(settings, '$.api_key') WHERE id = ?",
+                (status, summary, error, json.dumps(usage) if usage else None, time.time(), job_id)
+            )
+        finally:
+            conn.close()
+
+    def fail_unfinished(self, batch_id: str, error: str) -> int:
+        """
+        将批次中尚未完成的任务标记为失败（例如等待超时、没有worker在运行）
+
+        Returns:
+            标记为失败的任务数
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, "
+                "settings = json_remove(settings, '$.api_key') "
+                "WHERE batch_id = ? AND status IN (?, ?)",
+                (self.FAILED, error, time.time(), batch_id, self.PENDING, self.RUNNING)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def delete_batch(self, batch_id: str):
+        """删除批次的所有任务（app读取结果后调用，总结缓存不受影响）"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE batch_id = ?", (batch_id,))
+        finally:
+            conn.close()
+
+    def prune(self, max_age: float, cache_max_age: Optional[float] = None):
+        """
+        删除创建超过 max_age 秒的任务（app在等待过程中崩溃时遗留的批次），
+        以及写入超过 cache_max_age 秒的总结缓存
+
+        Returns:
+            (删除的任务数, 删除的缓存条目数)
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            jobs = conn.execute("DELETE FROM jobs WHERE created_at < ?", (now - max_age,)).rowcount
+            cached = 0
+            if cache_max_age is not None:
+                cached = conn.execute(
+                    "DELETE FROM summary_cache WHERE created_at < ?", (now - cache_max_age,)
+                ).rowcount
+            return jobs, cached
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str):
+        """worker处理任务期间定时调用，表明任务仍在运行（长时间的OCR不会被误判为失联）"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+                (time.time(), job_id, self.RUNNING)
+            )
+        finally:
+            conn.close()
+
+    def requeue_stale(self, timeout: float) -> int:
+        """
+        将超时未完成的任务重新放回队列（例如worker崩溃或容器被重启）
+
+        Args:
+            timeout: 超过该秒数没有心跳的运行中任务视为失联
+
+        Returns:
+            重新入队的任务数
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, started_at = NULL, heartbeat_at = NULL "
+                "WHERE status = ? AND COALESCE(heartbeat_at, started_at) < ?",
+                (self.PENDING, self.RUNNING, time.time() - timeout)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def batch_jobs(self, batch_id: str) -> List[Dict]:
+        """按提交顺序返回批次中的所有任务"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, seq, file_name, file_path, status, summary, error, usage, worker_id, heartbeat_at "
+                "FROM jobs WHERE batch_id = ? ORDER BY seq",
+                (batch_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def queue_stats(self, window: float = 300) -> Dict:
+        """
+        队列监控指标
+
+        Args:
+            window: 统计排队等待时间的时间窗口（秒）
+
+        Returns:
+            待处理/运行中任务数、活跃worker数和最近任务的平均/最大排队等待时间
+        """
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status",
+                (self.PENDING, self.RUNNING)
+            ).fetchall())
+            workers = conn.execute(
+                "SELECT COUNT(DISTINCT worker_id) FROM jobs WHERE status = ?", (self.RUNNING,)
+            ).fetchone()[0]
+            wait = conn.execute(
+                "SELECT AVG(started_at - created_at), MAX(started_at - created_at) FROM jobs WHERE started_at > ?",
+                (time.time() - window,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            'pending': counts.get(self.PENDING, 0),
+            'running': counts.get(self.RUNNING, 0),
+            'busy_workers': workers,
+            'wait_avg': wait[0] or 0.0,
+            'wait_max': wait[1] or 0.0,
+        }
+
+    def get_cached(self, cache_key: str) -> Optional[str]:
+        """查询总结缓存"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT summary FROM summary_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row['summary'] if row else None
+
+    def put_cached(self, cache_key: str, summary: str):
+        """写入总结缓存"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO summary_cache (cache_key, summary, created_at) VALUES (?, ?, ?)",
+                (cache_key, summary, time.time())
+            )
+        finally:
+            conn.close()
+
+
+def write_json_atomic(path: str, data: Dict):
+    """
+    原子地写入JSON文件
+
+    先写临时文件再 os.replace，多个进程同时保存配置时不会读到写了一半的文件。
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
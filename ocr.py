@@ -0,0 +1,136 @@
+import os
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from blob_store import hash_file
+
+# 可选依赖：PyMuPDF（页面渲染）和 pytesseract（需要系统安装 tesseract-ocr）
+# 仅在真正需要OCR时于子进程中导入，未安装时只影响扫描版PDF
+
+# 进程内共享的OCR进程池：Web应用中多篇论文同时OCR时共用同一组进程，
+# 总进程数不超过 OCR_WORKERS（默认为CPU核数与4中的较小值）
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool() -> ProcessPoolExecutor:
+    """首次使用时创建共享进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv('OCR_WORKERS', '0')) or min(os.cpu_count() or 1, 4)
+            # 使用spawn启动子进程，避免在多线程的Web应用中fork
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_shared_pool(broken: ProcessPoolExecutor):
+    """子进程异常退出（崩溃或被OOM终止）后进程池不可再用，丢弃它以便下次重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def check_ocr_available():
+    """检查OCR依赖是否可用，不可用时抛出带安装说明的异常"""
+    try:
+        import fitz  # noqa: F401
+        import pytesseract
+        pytesseract.get_tesseract_version()
+    except ImportError:
+        raise Exception("OCR需要安装可选依赖: pip install pymupdf pytesseract")
+    except Exception:
+        raise Exception("未找到 tesseract 程序，请先安装 tesseract-ocr（以及 tesseract-ocr-chi-sim 语言包）")
+
+
+def _ocr_page(pdf_path: str, page_num: int, lang: str, dpi: int) -> str:
+    """在子进程中渲染并识别单页"""
+    import io
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    with fitz.open(pdf_path) as doc:
+        pixmap = doc[page_num].get_pixmap(dpi=dpi)
+        image = Image.open(io.BytesIO(pixmap.tobytes("png")))
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+def ocr_pdf(pdf_path: str, pages: Optional[List[int]] = None, lang: str = "chi_sim+eng", dpi: int = 200,
+            max_workers: Optional[int] = None, cache_dir: Optional[str] = "data/ocr_cache") -> str:
+    """
+    对PDF页面进行OCR
+
+    页面在进程池中并行识别；每页结果按 文件哈希 + 页码 + 语言 + 分辨率 缓存到磁盘，
+    同一PDF再次处理时直接读取缓存。
+
+    Args:
+        pdf_path: PDF文件路径
+        pages: 要识别的页码列表（从0开始），None表示全部页面
+        lang: tesseract语言
+        dpi: 渲染分辨率
+        max_workers: 使用该进程数的独立进程池，默认使用进程内共享的进程池（OCR_WORKERS）
+        cache_dir: 缓存目录，None表示不缓存
+
+    Returns:
+        按页码顺序拼接的识别文本
+    """
+    check_ocr_available()
+
+    if pages is None:
+        import fitz
+        with fitz.open(pdf_path) as doc:
+            pages = list(range(doc.page_count))
+
+    cache_path = None
+    texts = {}
+    if cache_dir:
+        cache_path = Path(cache_dir)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        file_hash = hash_file(pdf_path)
+
+        def cache_file(page_num):
+            return cache_path / f"{file_hash}_{page_num}_{lang.replace('+', '-')}_{dpi}.txt"
+
+        for page_num in pages:
+            if cache_file(page_num).exists():
+                texts[page_num] = cache_file(page_num).read_text(encoding='utf-8')
+
+    missing = [page_num for page_num in pages if page_num not in texts]
+    if missing:
+        print(f"🔍 OCR识别 {len(missing)} 页（缓存命中 {len(pages) - len(missing)} 页）...")
+        for attempt in range(2):
+            if max_workers:
+                # 指定进程数时使用独立进程池（基准测试）
+                pool = ProcessPoolExecutor(max_workers=min(max_workers, len(missing)),
+                                           mp_context=multiprocessing.get_context('spawn'))
+            else:
+                pool = _shared_pool()
+            try:
+                results = list(pool.map(_ocr_page, [pdf_path] * len(missing), missing,
+                                        [lang] * len(missing), [dpi] * len(missing)))
+                break
+            except BrokenProcessPool:
+                if not max_workers:
+                    _reset_shared_pool(pool)
+                if attempt:
+                    raise Exception("OCR子进程异常退出（可能内存不足），请减少 OCR_WORKERS 后重试")
+                print("⚠️ OCR子进程异常退出，重建进程池后重试...")
+            finally:
+                if max_workers:
+                    pool.shutdown()
+
+        for page_num, text in zip(missing, results):
+            texts[page_num] = text
+            if cache_path:
+                # 先写临时文件再替换，避免并发进程读到半个文件
+                tmp_file = cache_file(page_num).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_file.write_text(text, encoding='utf-8')
+                os.replace(tmp_file, cache_file(page_num))
+
+    return '\n'.join(texts[page_num] for page_num in pages)
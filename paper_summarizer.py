@@ -1,17 +1,126 @@
 import os
+import re
 import json
+import time
 import base64
+import threading
 from pathlib import Path
-from typing import List, Dict
-import PyPDF2
-from openai import OpenAI
-import requests
+from typing import List, Dict, Optional
+from usage import (UsageTracker, BudgetExceeded, GEMINI_TOKENS_PER_PDF_PAGE, estimate_tokens,
+                   format_usage_line, load_price_table)
+from blob_store import mapped_file
+from structured import (SUMMARY_SCHEMA, SECTIONS, gemini_schema, structured_instruction, repair_json,
+                        validate_summary, render_markdown)
+
+# 注意：PyPDF2、openai、requests 均在实际使用处延迟导入，
+# 这样 `--help`、纯配置操作以及 Gemini 原生路径不必为用不到的后端付出导入开销
+
+# 参考文献/附录标题：整行只能是（可选的章节编号 +）关键词（+ 附录编号），最多带一个结尾冒号或句号，
+# 后面跟有正文的行（例如 "Appendix. Column 2 adds ..."）不算标题
+BACK_MATTER_HEADING = re.compile(
+    r'^(?:(?:\d+|[IVX]+)\.?\s*)?'
+    r'(?P<keyword>references|bibliography|works\s+cited|literature\s+cited|参考文献'
+    r'|(?:online\s+)?(?:appendix|appendices)(?:\s+[A-Z\d](?:\.\d+)?)?|附\s*录(?:\s*[A-Z\d一二三四五六])?)'
+    r'\s*[:：.]?$',
+    re.IGNORECASE
+)
+
+
+# 文本输入截断长度和输出token上限
+MAX_INPUT_CHARS = 16000
+MAX_OUTPUT_TOKENS = 4000
+
+# 平均每页提取的字符数低于该值时视为扫描版PDF
+OCR_MIN_CHARS_PER_PAGE = 50
+
+
+def is_back_matter_heading(line: str) -> bool:
+    """
+    判断一行文本（或书签标题）是否为参考文献/附录的标题
+
+    英文标题要求首字母大写（References / REFERENCES），正文中换行后落在行首的小写单词不算标题。
+
+    >>> is_back_matter_heading("References")
+    True
+    >>> is_back_matter_heading("7. REFERENCES")
+    True
+    >>> is_back_matter_heading("Appendix B:")
+    True
+    >>> is_back_matter_heading("参考文献")
+    True
+    >>> is_back_matter_heading("appendix. Column 2 adds firm fixed effects and year dummies.")
+    False
+    >>> is_back_matter_heading("References: Smith (2019) documents a similar pattern.")
+    False
+    >>> is_back_matter_heading("references")
+    False
+    """
+    match = BACK_MATTER_HEADING.match(line.strip())
+    return match is not None and not match.group('keyword')[0].islower()
+
+
+def find_back_matter_offset(page_text: str) -> Optional[int]:
+    """
+    在单页文本中查找参考文献/附录标题
+
+    Returns:
+        标题所在行在文本中的起始位置，未找到时返回None
+    """
+    offset = 0
+    for line in page_text.splitlines(keepends=True):
+        if is_back_matter_heading(line):
+            return offset
+        offset += len(line)
+    return None
+
+
+def parse_page_ranges(page_ranges: str, total_pages: int) -> List[int]:
+    """
+    解析页码范围字符串
+
+    Args:
+        page_ranges: 形如 "1-10,12,15-" 的页码范围（从1开始，"15-" 表示到最后一页）
+        total_pages: PDF总页数
+
+    Returns:
+        升序排列的页码列表（从0开始）
+
+    >>> parse_page_ranges("1-3,5", 10)
+    [0, 1, 2, 4]
+    >>> parse_page_ranges("8-", 10)
+    [7, 8, 9]
+    >>> parse_page_ranges("2，2-3, 12", 10)
+    [1, 2]
+    >>> parse_page_ranges("x", 10)
+    Traceback (most recent call last):
+    ...
+    ValueError: 无效的页码范围: x
+    """
+    pages = set()
+    for part in page_ranges.replace('，', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r'(\d+)?\s*(-)?\s*(\d+)?', part)
+        if not match or not (match.group(1) or match.group(3)):
+            raise ValueError(f"无效的页码范围: {part}")
+        start = int(match.group(1)) if match.group(1) else 1
+        if match.group(2):
+            end = int(match.group(3)) if match.group(3) else total_pages
+        else:
+            end = start
+        pages.update(range(max(start, 1) - 1, min(end, total_pages)))
+    if not pages:
+        raise ValueError(f"页码范围 {page_ranges} 未选中任何页面（共 {total_pages} 页）")
+    return sorted(pages)
 
 
 class PaperSummarizer:
     """论文总结器 - 使用OpenAI API总结PDF论文"""
 
-    def __init__(self, api_key: str, base_url: str = None, model: str = "gpt-3.5-turbo"):
+    def __init__(self, api_key: str, base_url: str = None, model: str = "gpt-3.5-turbo",
+                 skip_references: bool = False, page_ranges: str = None, ocr_fallback: bool = False,
+                 usage_tracker: UsageTracker = None, structured: bool = False):
         """
         初始化论文总结器
 
@@ -19,19 +128,29 @@ class PaperSummarizer:
             api_key: OpenAI API密钥
             base_url: API基础URL（支持兼容OpenAI格式的API）
             model: 使用的模型名称
+            skip_references: 是否跳过参考文献和附录页
+            page_ranges: 只处理指定页码范围，例如 "1-20"（从1开始）
+            ocr_fallback: 文本提取量过低（扫描版PDF）时是否使用本地OCR
+            usage_tracker: token用量统计和预算控制（默认只统计不限制）
+            structured: 是否要求模型按JSON Schema输出结构化总结
         """
         self.api_key = api_key
         self.model = model
         self.base_url = base_url
+        self.skip_references = skip_references
+        self.page_ranges = page_ranges
+        self.ocr_fallback = ocr_fallback
+        self.usage = usage_tracker or UsageTracker()
+        self.structured = structured
+
+        # 记录当前线程最近一次API调用的用量（多个线程可能共享同一个实例）
+        self._local = threading.local()
 
         # 检测是否使用Gemini模型
         self.is_gemini = self._is_gemini_model(model)
 
-        # 初始化客户端
-        if base_url:
-            self.client = OpenAI(api_key=api_key, base_url=base_url)
-        else:
-            self.client = OpenAI(api_key=api_key)
+        # OpenAI客户端在首次使用时才创建（见 client 属性）
+        self._client = None
 
         # 如果是Gemini模型且有base_url，使用Gemini原生格式（通过new-api）
         if self.is_gemini and base_url:
@@ -41,6 +160,25 @@ class PaperSummarizer:
         """检测是否为Gemini模型"""
         return model.lower().startswith('gemini')
 
+    def _record_usage(self, model: str, prompt_tokens: int, completion_tokens: int, elapsed: float):
+        """记录一次API调用的用量（model 为本次调用实际使用的模型）"""
+        usage = self.usage.record(model, prompt_tokens, completion_tokens, elapsed)
+        self._local.last_usage = usage
+        print(f"📊 Token用量: 输入 {prompt_tokens} / 输出 {completion_tokens}" +
+              (f"，约 ${usage['cost']:.4f}" if usage['cost'] is not None else ""))
+
+    @property
+    def client(self):
+        """OpenAI客户端（延迟创建，Gemini原生路径不会导入openai）"""
+        if self._client is None:
+            from openai import OpenAI
+
+            if self.base_url:
+                self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            else:
+                self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
     @property
     def default_prompt(self):
         """默认的总结prompt（针对实证研究论文）"""
@@ -77,6 +215,89 @@ class PaperSummarizer:
 论文内容：
 {content}"""
 
+    def _find_back_matter_page_from_outline(self, pdf_reader) -> Optional[int]:
+        """
+        通过PDF书签查找参考文献/附录的起始页
+
+        Returns:
+            起始页码（从0开始），没有书签或未找到时返回None
+        """
+        try:
+            outline = pdf_reader.outline
+        except Exception:
+            return None
+
+        pages = []
+        stack = list(outline)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(item)
+                continue
+            title = getattr(item, 'title', None) or ''
+            if is_back_matter_heading(title):
+                try:
+                    page_num = pdf_reader.get_destination_page_number(item)
+                except Exception:
+                    continue
+                # 第一页出现的"参考文献"书签多半是目录，忽略
+                if page_num and page_num > 0:
+                    pages.append(page_num)
+
+        return min(pages) if pages else None
+
+    def _select_pages(self, pdf_reader, collect_text: bool = True):
+        """
+        根据页码范围和参考文献/附录检测选出需要处理的页面
+
+        优先使用书签定位参考文献/附录；没有书签时逐页提取文本，
+        遇到参考文献/附录标题即停止，后续页面不再解析。
+
+        Args:
+            pdf_reader: PyPDF2.PdfReader
+            collect_text: 是否需要返回文本（Gemini原生路径只需要页码）
+
+        Returns:
+            (选中的页码列表, 提取的文本, 参考文献/附录起始页)
+        """
+        total_pages = len(pdf_reader.pages)
+        if self.page_ranges:
+            pages = parse_page_ranges(self.page_ranges, total_pages)
+        else:
+            pages = list(range(total_pages))
+
+        boundary = None
+        if self.skip_references:
+            boundary = self._find_back_matter_page_from_outline(pdf_reader)
+            if boundary is not None:
+                pages = [p for p in pages if p < boundary]
+
+        selected = []
+        text_parts = []
+        for page_num in pages:
+            scan = self.skip_references and boundary is None
+            if not (collect_text or scan):
+                selected.append(page_num)
+                continue
+
+            page_text = pdf_reader.pages[page_num].extract_text() or ''
+
+            # 只在文档后2/3中查找，避免把正文里换行后的 "Appendix A" 之类误判为标题
+            in_tail = page_num > 0 and page_num >= total_pages // 3
+            offset = find_back_matter_offset(page_text) if scan and in_tail else None
+            if offset is not None:
+                boundary = page_num
+                # 标题之前的内容（通常是结论的末尾）仍然保留
+                if page_text[:offset].strip():
+                    selected.append(page_num)
+                    text_parts.append(page_text[:offset])
+                break
+
+            selected.append(page_num)
+            text_parts.append(page_text)
+
+        return selected, ''.join(text_parts), boundary
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
         从PDF文件中提取文本
@@ -88,20 +309,34 @@ class PaperSummarizer:
             提取的文本内容
         """
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-
-                # 提取所有页面的文本
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text()
+            import PyPDF2
+
+            # PdfReader直接读取mmap，不需要把整个文件读入内存
+            with mapped_file(pdf_path) as pdf_data:
+                pdf_reader = PyPDF2.PdfReader(pdf_data)
+                total_pages = len(pdf_reader.pages)
+                selected, text, boundary = self._select_pages(pdf_reader)
+
+                # 平均每页文本过少，多半是扫描版PDF，改用OCR
+                if self.ocr_fallback and len(text.strip()) < max(100, OCR_MIN_CHARS_PER_PAGE * len(selected)):
+                    from ocr import ocr_pdf
+
+                    print(f"⚠️ 仅提取到 {len(text.strip())} 字符，疑似扫描版PDF，启用OCR...")
+                    text = ocr_pdf(
+                        pdf_path,
+                        pages=selected,
+                        lang=os.getenv('OCR_LANG', 'chi_sim+eng'),
+                        cache_dir=os.getenv('OCR_CACHE_DIR', 'data/ocr_cache')
+                    )
 
                 # 验证提取的文本
                 if not text or len(text.strip()) < 100:
                     raise Exception(f"PDF文本提取失败或内容太少（提取到 {len(text)} 字符）")
 
-                print(f"✅ 成功提取 {len(text)} 字符，共 {len(pdf_reader.pages)} 页")
+                print(f"✅ 成功提取 {len(text)} 字符，共 {total_pages} 页")
+                if len(selected) < total_pages:
+                    print(f"✂️ 仅解析 {len(selected)}/{total_pages} 页" +
+                          (f"（参考文献/附录从第 {boundary + 1} 页开始，已跳过）" if boundary is not None else ""))
 
                 # 显示提取内容的前100个字符预览
                 preview = text.strip()[:100].replace('\n', ' ')
@@ -111,37 +346,107 @@ class PaperSummarizer:
         except Exception as e:
             raise Exception(f"PDF文本提取失败: {str(e)}")
 
-    def summarize_text(self, text: str, custom_prompt: str = None) -> str:
+    def prepare_pdf_for_upload(self, pdf_data):
+        """
+        准备要直接发送给Gemini的PDF数据
+
+        启用页码范围或跳过参考文献时，只把选中的页面写入新的PDF，减少上传字节数和token数。
+
+        Args:
+            pdf_data: PDF文件内容（bytes或mmap）
+
+        Returns:
+            要发送的PDF内容，未裁剪时原样返回 pdf_data
+        """
+        if not (self.skip_references or self.page_ranges):
+            return pdf_data
+
+        import io
+        import PyPDF2
+
+        pdf_reader = PyPDF2.PdfReader(pdf_data)
+        total_pages = len(pdf_reader.pages)
+        selected, _, boundary = self._select_pages(pdf_reader, collect_text=False)
+        if len(selected) == total_pages:
+            return pdf_data
+
+        pdf_writer = PyPDF2.PdfWriter()
+        for page_num in selected:
+            pdf_writer.add_page(pdf_reader.pages[page_num])
+        output = io.BytesIO()
+        pdf_writer.write(output)
+
+        print(f"✂️ 仅发送 {len(selected)}/{total_pages} 页" +
+              (f"（参考文献/附录从第 {boundary + 1} 页开始，已跳过）" if boundary is not None else ""))
+        return output.getvalue()
+
+    def summarize_text(self, text: str, custom_prompt: str = None, model: str = None) -> str:
         """
         使用OpenAI API总结文本
 
         Args:
             text: 要总结的文本
             custom_prompt: 自定义的prompt模板
+            model: 本次调用使用的模型（默认为 self.model）
 
         Returns:
             总结后的文本
         """
+        model = model or self.model
         try:
             # 使用自定义prompt或默认prompt
             prompt_template = custom_prompt if custom_prompt else self.default_prompt
-            prompt = prompt_template.format(content=text[:16000])  # 增加输入长度限制
+            prompt = prompt_template.format(content=text[:MAX_INPUT_CHARS])  # 增加输入长度限制
+
+            # 结构化模式优先用JSON Schema约束输出；gpt-3.5-turbo 和部分兼容API不支持时，
+            # 依次退回 json_object 和不带 response_format（依靠prompt说明 + 本地 repair_json）
+            response_formats = [None]
+            if self.structured:
+                prompt += structured_instruction()
+                response_formats = [
+                    {
+                        "type": "json_schema",
+                        "json_schema": {"name": "paper_summary", "schema": SUMMARY_SCHEMA, "strict": True}
+                    },
+                    {"type": "json_object"},
+                    None
+                ]
 
             print(f"🔄 准备调用API...")
-            print(f"   模型: {self.model}")
+            print(f"   模型: {model}")
             print(f"   输入长度: {len(prompt)} 字符")
 
             # 调用OpenAI API
             print(f"⏳ 正在调用API生成总结，请稍候...")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的学术论文分析助手。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=4000  # 增加输出token限制
-            )
+            start = time.time()
+            for i, response_format in enumerate(response_formats):
+                extra_params = {'response_format': response_format} if response_format else {}
+                try:
+                    response = self.client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": "你是一个专业的学术论文分析助手。"},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.7,
+                        max_tokens=MAX_OUTPUT_TOKENS,  # 增加输出token限制
+                        **extra_params
+                    )
+                    break
+                except Exception as e:
+                    if i + 1 < len(response_formats) and self._is_response_format_rejected(e):
+                        next_format = response_formats[i + 1]
+                        print(f"⚠️ API不支持 response_format={response_format['type']}，改用 " +
+                              (next_format['type'] if next_format else "prompt约束") + " 重试")
+                        continue
+                    raise
+            elapsed = time.time() - start
+
+            if getattr(response, 'usage', None):
+                self._record_usage(model, response.usage.prompt_tokens or 0, response.usage.completion_tokens or 0, elapsed)
+            else:
+                # 部分兼容API不返回usage，按字符数估算
+                self._record_usage(model, estimate_tokens(prompt), 0, elapsed)
 
             # 验证响应
             if not response.choices or len(response.choices) == 0:
@@ -164,54 +469,149 @@ class PaperSummarizer:
             print(f"❌ API调用错误详情: {str(e)}")
             raise Exception(f"API调用失败: {str(e)}")
 
-    def summarize_paper(self, pdf_path: str, custom_prompt: str = None) -> Dict:
+    @staticmethod
+    def _is_response_format_rejected(error: Exception) -> bool:
+        """判断API错误是否为不支持 response_format 导致的400错误"""
+        if getattr(error, 'status_code', None) != 400:
+            return False
+        message = str(error).lower()
+        return 'response_format' in message or 'json_schema' in message or 'json_object' in message
+
+    def _apply_budget(self) -> str:
+        """
+        API调用前检查预算，返回本次调用应使用的模型（预算用完时抛出 BudgetExceeded）
+
+        不修改 self.model：同一实例被多个调度线程共享，降级只作用于当前这次调用
+        """
+        model = self.usage.select_model(self.model)
+        if model != self.model:
+            print(f"💸 用量接近预算，模型从 {self.model} 降级为 {model}")
+        return model
+
+    def summarize_paper(self, pdf_path: str, custom_prompt: str = None, file_name: str = None) -> Dict:
         """
         总结单篇论文
 
         Args:
             pdf_path: PDF文件路径
             custom_prompt: 自定义prompt
+            file_name: 显示用的文件名（默认取路径中的文件名；存储在内容寻址目录中的文件需要传入原始文件名）
 
         Returns:
-            包含文件名和总结的字典
+            包含文件名、总结和token用量的字典
         """
-        file_name = Path(pdf_path).name
+        file_name = file_name or Path(pdf_path).name
         print(f"正在处理: {file_name}")
 
-        if self.is_gemini and self.base_url:
+        model = self._apply_budget()
+        self._local.last_usage = None
+
+        if self._is_gemini_model(model) and self.base_url:
             # Gemini模式（通过new-api）：使用原生格式直接读取PDF
-            summary = self.summarize_pdf_with_gemini_native(pdf_path, custom_prompt)
+            summary = self.summarize_pdf_with_gemini_native(pdf_path, custom_prompt, model)
         else:
             # 其他模式：提取文本后总结
             text = self.extract_text_from_pdf(pdf_path)
-            summary = self.summarize_text(text, custom_prompt)
+            summary = self.summarize_text(text, custom_prompt, model)
 
-        return {
+        usage = self._local.last_usage
+        if usage:
+            usage['label'] = file_name
+
+        result = {
             "file_name": file_name,
             "summary": summary,
-            "file_path": pdf_path
+            "file_path": pdf_path,
+            "usage": usage
+        }
+        if self.structured:
+            result["structured"] = self.parse_structured_summary(summary)
+            result["summary"] = render_markdown(result["structured"])
+        return result
+
+    def parse_structured_summary(self, raw: str) -> Dict:
+        """
+        解析、修复并校验模型返回的结构化总结
+
+        部分章节为空时只给出警告；完全无法解析或所有章节都为空时抛出异常。
+
+        Args:
+            raw: 模型返回的原始文本
+
+        Returns:
+            符合 SUMMARY_SCHEMA 的字典
+        """
+        try:
+            data = repair_json(raw)
+        except ValueError as e:
+            raise Exception(f"结构化输出无效: {str(e)}")
+
+        errors = validate_summary(data)
+        if len(errors) == len(SECTIONS):
+            raise Exception("结构化输出校验失败: 所有章节均为空")
+        for error in errors:
+            print(f"⚠️ 结构化输出: {error}")
+        return data
+
+    def estimate_paper(self, pdf_path: str, custom_prompt: str = None) -> Dict:
+        """
+        不调用API，估算单篇论文的token用量和费用上限（用于 --dry-run）
+
+        Args:
+            pdf_path: PDF文件路径
+            custom_prompt: 自定义prompt
+
+        Returns:
+            包含文件名、估算输入token、输出token上限和费用上限的字典
+        """
+        import PyPDF2
+
+        prompt_template = custom_prompt if custom_prompt else self.default_prompt
+
+        if self.is_gemini and self.base_url:
+            # Gemini直接读取PDF，按页计费
+            with open(pdf_path, 'rb') as pdf_file:
+                pdf_reader = PyPDF2.PdfReader(pdf_file)
+                selected, _, _ = self._select_pages(pdf_reader, collect_text=False)
+            prompt_tokens = estimate_tokens(prompt_template) + len(selected) * GEMINI_TOKENS_PER_PDF_PAGE
+        else:
+            text = self.extract_text_from_pdf(pdf_path)
+            prompt_tokens = estimate_tokens(prompt_template.format(content=text[:MAX_INPUT_CHARS]))
+
+        return {
+            "file_name": Path(pdf_path).name,
+            "model": self.model,
+            "prompt_tokens": prompt_tokens,
+            "max_completion_tokens": MAX_OUTPUT_TOKENS,
+            "max_cost": self.usage.cost(self.model, prompt_tokens, MAX_OUTPUT_TOKENS)
         }
 
-    def summarize_pdf_with_gemini_native(self, pdf_path: str, custom_prompt: str = None) -> str:
+    def summarize_pdf_with_gemini_native(self, pdf_path: str, custom_prompt: str = None, model: str = None) -> str:
         """
         使用Gemini原生格式（通过new-api）直接读取并总结PDF
 
         Args:
             pdf_path: PDF文件路径
             custom_prompt: 自定义prompt
+            model: 本次调用使用的模型（默认为 self.model）
 
         Returns:
             总结后的文本
         """
+        import requests
+
+        model = model or self.model
         try:
             print(f"📄 使用Gemini原生格式直接读取PDF文件...")
 
-            # 读取PDF文件并进行base64编码
-            with open(pdf_path, 'rb') as pdf_file:
-                pdf_data = pdf_file.read()
+            # 通过mmap读取PDF文件（可能只保留选中的页面）并直接进行base64编码
+            with mapped_file(pdf_path) as mapped:
+                pdf_data = self.prepare_pdf_for_upload(mapped)
+                pdf_size = len(pdf_data)
                 pdf_base64 = base64.b64encode(pdf_data).decode('utf-8')
+                del pdf_data
 
-            print(f"✅ PDF文件读取成功，大小: {len(pdf_data)} 字节")
+            print(f"✅ PDF文件读取成功，大小: {pdf_size} 字节")
 
             # 准备prompt
             prompt_template = custom_prompt if custom_prompt else self.default_prompt
@@ -220,6 +620,8 @@ class PaperSummarizer:
                 prompt_text = prompt_template.replace('{content}', '请分析上传的PDF文件。')
             else:
                 prompt_text = prompt_template
+            if self.structured:
+                prompt_text += structured_instruction()
 
             # 构建Gemini原生格式请求URL
             # 移除base_url末尾的斜杠和/v1路径
@@ -227,10 +629,10 @@ class PaperSummarizer:
             if base.endswith('/v1'):
                 base = base[:-3]
 
-            url = f"{base}/v1beta/models/{self.model}:generateContent?key={self.api_key}"
+            url = f"{base}/v1beta/models/{model}:generateContent?key={self.api_key}"
 
             print(f"🔄 准备调用Gemini API...")
-            print(f"   模型: {self.model}")
+            print(f"   模型: {model}")
             print(f"   端点: {url[:100]}...")
             headers = {
                 'Content-Type': 'application/json'
@@ -250,9 +652,17 @@ class PaperSummarizer:
                 }]
             }
 
+            if self.structured:
+                payload["generationConfig"] = {
+                    "responseMimeType": "application/json",
+                    "responseSchema": gemini_schema(SUMMARY_SCHEMA)
+                }
+
             # 调用Gemini API
             print(f"⏳ 正在调用API生成总结，请稍候...")
+            start = time.time()
             response = requests.post(url, headers=headers, json=payload, timeout=300)
+            elapsed = time.time() - start
 
             # 检查响应状态
             if response.status_code != 200:
@@ -272,6 +682,14 @@ class PaperSummarizer:
 
             summary = candidate['content']['parts'][0].get('text', '')
 
+            usage_metadata = result.get('usageMetadata', {})
+            self._record_usage(
+                model,
+                usage_metadata.get('promptTokenCount', 0),
+                usage_metadata.get('candidatesTokenCount', 0) + usage_metadata.get('thoughtsTokenCount', 0),
+                elapsed
+            )
+
             # 验证响应
             if not summary or len(summary.strip()) < 50:
                 raise Exception(f"API返回内容太少或为空（长度: {len(summary)}）")
@@ -313,10 +731,20 @@ class PaperSummarizer:
 
         print(f"找到 {len(pdf_files)} 个PDF文件")
 
-        for pdf_file in pdf_files:
+        for index, pdf_file in enumerate(pdf_files):
             try:
                 summary_data = self.summarize_paper(str(pdf_file), custom_prompt)
                 summaries.append(summary_data)
+            except BudgetExceeded as e:
+                # 预算用完，剩余论文不再调用API
+                print(f"⛔ {str(e)}，跳过剩余 {len(pdf_files) - index} 篇论文")
+                for skipped in pdf_files[index:]:
+                    summaries.append({
+                        "file_name": skipped.name,
+                        "summary": f"已跳过: {str(e)}",
+                        "file_path": str(skipped)
+                    })
+                break
             except Exception as e:
                 print(f"处理 {pdf_file.name} 时出错: {str(e)}")
                 summaries.append({
@@ -344,12 +772,50 @@ class PaperSummarizer:
             for i, summary_data in enumerate(summaries, 1):
                 f.write(f"## {i}. {summary_data['file_name']}\n\n")
                 f.write(f"**文件路径**: `{summary_data['file_path']}`\n\n")
+                f.write(format_usage_line(summary_data.get('usage')))
                 f.write(f"{summary_data['summary']}\n\n")
                 f.write("---\n\n")
 
+            f.write(self.usage.format_markdown())
+
         print(f"总结已保存到: {output_path}")
 
 
+def print_estimates(summarizer: PaperSummarizer, folder_path: str, custom_prompt: str = None):
+    """打印文件夹中每篇论文的用量估算（--dry-run）"""
+    pdf_files = list(Path(folder_path).glob("*.pdf"))
+    if not pdf_files:
+        raise Exception(f"在 {folder_path} 中未找到PDF文件")
+
+    estimated = 0
+    total_prompt_tokens = 0
+    max_completion_tokens = 0
+    total_max_cost = 0.0
+    for pdf_file in pdf_files:
+        try:
+            estimate = summarizer.estimate_paper(str(pdf_file), custom_prompt)
+        except Exception as e:
+            print(f"⚠️ {pdf_file.name}: 无法估算（{str(e)}）")
+            continue
+        estimated += 1
+        total_prompt_tokens += estimate['prompt_tokens']
+        max_completion_tokens += estimate['max_completion_tokens']
+        if estimate['max_cost'] is None or total_max_cost is None:
+            total_max_cost = None
+        else:
+            total_max_cost += estimate['max_cost']
+        print(f"📄 {pdf_file.name}: 输入约 {estimate['prompt_tokens']} tokens，"
+              f"输出最多 {estimate['max_completion_tokens']} tokens")
+
+    skipped = len(pdf_files) - estimated
+    print(f"\n🧮 共 {estimated} 篇，模型 {summarizer.model}" + (f"（{skipped} 篇无法估算，未计入）" if skipped else ""))
+    print(f"   输入约 {total_prompt_tokens} tokens，输出最多 {max_completion_tokens} tokens")
+    if total_max_cost is None:
+        print("   费用: 未知（价格表中没有该模型）")
+    else:
+        print(f"   费用上限约 ${total_max_cost:.4f}")
+
+
 def main():
     """命令行使用示例"""
     import argparse
@@ -361,12 +827,23 @@ def main():
     parser.add_argument('--base-url', type=str, help='API基础URL（可选）')
     parser.add_argument('--model', type=str, default='gpt-3.5-turbo', help='使用的模型')
     parser.add_argument('--prompt', type=str, help='自定义prompt文件路径')
+    parser.add_argument('--skip-references', action='store_true', help='跳过参考文献和附录页')
+    parser.add_argument('--structured', action='store_true', help='结构化JSON输出（按Schema校验，并保存到JSONL存储）')
+    parser.add_argument('--store', type=str, help='结构化总结的JSONL存储路径（默认与输出文件同名，后缀为.jsonl）')
+    parser.add_argument('--pages', type=str, help='只处理指定页码范围，例如 "1-20"（从1开始）')
+    parser.add_argument('--ocr', action='store_true', help='扫描版PDF使用本地OCR（需要安装tesseract）')
+    parser.add_argument('--dry-run', action='store_true', help='只估算token用量和费用，不调用API')
+    parser.add_argument('--max-tokens', type=int, help='本批次token上限（输入+输出）')
+    parser.add_argument('--max-cost', type=float, help='本批次费用上限（美元，按价格表估算）')
+    parser.add_argument('--fallback-model', type=str, help='用量达到预算80%%后切换到的模型')
+    parser.add_argument('--price-table', type=str, default=os.getenv('PRICE_TABLE'),
+                        help='价格表JSON文件（美元/百万token，{"模型前缀": [输入, 输出]}）')
 
     args = parser.parse_args()
 
-    # 获取API密钥
+    # 获取API密钥（dry-run不调用API，可以不提供）
     api_key = args.api_key or os.getenv('OPENAI_API_KEY')
-    if not api_key:
+    if not api_key and not args.dry_run:
         print("错误: 请提供API密钥（通过--api-key参数或OPENAI_API_KEY环境变量）")
         return
 
@@ -376,18 +853,45 @@ def main():
         with open(args.prompt, 'r', encoding='utf-8') as f:
             custom_prompt = f.read()
 
+    usage_tracker = UsageTracker(
+        price_table=load_price_table(args.price_table),
+        max_tokens=args.max_tokens,
+        max_cost=args.max_cost,
+        fallback_model=args.fallback_model
+    )
+
     # 创建总结器
     summarizer = PaperSummarizer(
-        api_key=api_key,
+        api_key=api_key or '',
         base_url=args.base_url,
-        model=args.model
+        model=args.model,
+        skip_references=args.skip_references,
+        page_ranges=args.pages,
+        ocr_fallback=args.ocr,
+        usage_tracker=usage_tracker,
+        structured=args.structured
     )
 
+    if args.dry_run:
+        print_estimates(summarizer, args.folder, custom_prompt)
+        return
+
     # 处理论文
     summaries = summarizer.summarize_papers_in_folder(args.folder, custom_prompt)
 
     # 保存结果
     summarizer.save_summaries_to_markdown(summaries, args.output)
+    if args.structured:
+        from structured import SummaryStore
+
+        store = SummaryStore(args.store or str(Path(args.output).with_suffix('.jsonl')))
+        for summary_data in summaries:
+            if summary_data.get('structured'):
+                # 记录实际使用的模型（可能因预算降级）
+                used_model = (summary_data.get('usage') or {}).get('model') or summarizer.model
+                store.append(summary_data['file_name'], used_model, summary_data['structured'])
+        print(f"结构化总结已保存到: {store.path}")
+    print(usage_tracker.format_markdown())
     print("完成!")
 
 
@@ -0,0 +1,165 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+
+class FairScheduler:
+    """
+    按用户公平调度的线程池
+
+    每个用户（会话或API密钥）拥有独立队列，空闲线程按加权轮询从各用户队列取任务，
+    单个用户同时运行的任务数一般不超过 max_in_flight_per_user。其他用户都没有可运行任务时，
+    已达上限的用户可以继续占用空闲线程，但始终保留一个空闲线程（最多占用 max_workers - 1 个）。
+    因此上传100篇论文的批量任务能利用大部分空闲容量，新用户的单篇请求仍能立即开始执行。
+
+    >>> import threading, time
+    >>> release = threading.Event()
+    >>> scheduler = FairScheduler(max_workers=4, max_in_flight_per_user=2)
+    >>> bulk = [scheduler.submit('bulk', release.wait) for _ in range(12)]
+    >>> time.sleep(0.2)
+    >>> scheduler.stats()['busy']
+    3
+    >>> scheduler.submit('single', lambda: 'done').result(timeout=1)
+    'done'
+    >>> release.set()
+    """
+
+    def __init__(self, max_workers: int = 4, max_in_flight_per_user: int = 2,
+                 weights: Optional[Dict[str, int]] = None):
+        """
+        初始化调度器
+
+        Args:
+            max_workers: 工作线程总数（即同时进行的API调用上限）
+            max_in_flight_per_user: 单个用户同时运行的任务上限（其他用户都没有排队时可以超出，但总要留一个空闲线程）
+            weights: 用户权重，每轮轮询中该用户可连续取出的任务数（默认1）
+        """
+        self.max_workers = max_workers
+        self.max_in_flight_per_user = max_in_flight_per_user
+        self.weights = weights or {}
+
+        self._lock = threading.Condition()
+        self._queues = {}        # 用户 -> 待处理任务队列（仅包含非空队列）
+        self._order = deque()    # 轮询顺序
+        self._turns = {}         # 用户在本轮剩余的连续取任务次数
+        self._in_flight = {}     # 用户 -> 正在运行的任务数
+
+        # 监控指标：忙碌线程数、已完成任务数、最近任务的排队等待时间（秒）
+        self._busy = 0
+        self._completed = 0
+        self._wait_times = deque(maxlen=1000)
+
+        for i in range(max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"fair-scheduler-{i}", daemon=True)
+            thread.start()
+
+    def _weight(self, user_key: str) -> int:
+        return max(1, self.weights.get(user_key, 1))
+
+    def submit(self, user_key: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        提交任务到指定用户的队列
+
+        Args:
+            user_key: 用户标识（会话ID或API密钥摘要）
+            fn: 要执行的函数
+
+        Returns:
+            任务对应的Future
+        """
+        future = Future()
+        with self._lock:
+            if user_key not in self._queues:
+                self._queues[user_key] = deque()
+                self._order.append(user_key)
+                self._turns[user_key] = self._weight(user_key)
+            self._queues[user_key].append((future, fn, args, kwargs, time.time()))
+            self._lock.notify()
+        return future
+
+    def stats(self) -> Dict:
+        """
+        当前排队、运行中的任务数和排队等待时间（用于监控和压测）
+
+        只返回汇总数字，不包含用户标识（会话ID可用于访问他人的Gradio队列）
+        """
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            return {
+                'max_workers': self.max_workers,
+                'busy': self._busy,
+                'completed': self._completed,
+                'queued_total': sum(len(queue) for queue in self._queues.values()),
+                'users_queued': len(self._queues),
+                'users_running': sum(1 for n in self._in_flight.values() if n),
+                'wait_p50': wait_times[len(wait_times) // 2] if wait_times else 0.0,
+                'wait_p95': wait_times[int(len(wait_times) * 0.95)] if wait_times else 0.0,
+                'wait_max': wait_times[-1] if wait_times else 0.0,
+            }
+
+    def _next_task(self):
+        """
+        按加权轮询选出下一个可运行的任务，调用方需持有锁
+
+        优先选择未达到上限的用户；所有排队用户都已达到上限时，只要取走任务后仍有空闲线程，
+        就继续按轮询顺序为其中的用户执行任务，剩下的一个线程留给新用户。
+        """
+        if not self._order:
+            return None
+        for _ in range(len(self._order)):
+            user_key = self._order[0]
+            if self._in_flight.get(user_key, 0) < self.max_in_flight_per_user:
+                return self._take(user_key)
+            # 该用户已达上限，本轮跳过
+            self._order.rotate(-1)
+        # 当前线程尚未计入 _busy：取走任务后至少还要剩一个空闲线程
+        if self._busy + 2 <= self.max_workers:
+            return self._take(self._order[0])
+        return None
+
+    def _take(self, user_key: str):
+        """从位于轮询队首的用户队列中取出一个任务，调用方需持有锁"""
+        queue = self._queues[user_key]
+        task = queue.popleft()
+        self._in_flight[user_key] = self._in_flight.get(user_key, 0) + 1
+        self._turns[user_key] -= 1
+
+        if not queue:
+            self._order.popleft()
+            del self._queues[user_key]
+            del self._turns[user_key]
+        elif self._turns[user_key] <= 0:
+            self._order.rotate(-1)
+            self._turns[user_key] = self._weight(user_key)
+
+        return user_key, task
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                picked = self._next_task()
+                while picked is None:
+                    self._lock.wait()
+                    picked = self._next_task()
+
+                user_key, (future, fn, args, kwargs, submitted_at) = picked
+                self._busy += 1
+                self._wait_times.append(time.time() - submitted_at)
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._completed += 1
+                    self._in_flight[user_key] -= 1
+                    if not self._in_flight[user_key]:
+                        del self._in_flight[user_key]
+                    # 释放名额后，被上限挡住的任务可能变为可运行
+                    self._lock.notify_all()
@@ -0,0 +1,54 @@
+"""
+OCR吞吐量基准测试
+
+对同一份扫描版PDF分别用不同进程数进行OCR，报告冷缓存和热缓存下的 页/秒。
+
+用法:
+    python scripts/bench_ocr.py scanned.pdf
+    python scripts/bench_ocr.py scanned.pdf --workers 1 2 4 8 --pages 10
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+# 允许从项目根目录导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ocr import ocr_pdf, check_ocr_available  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR吞吐量基准测试')
+    parser.add_argument('pdf', type=str, help='用于测试的PDF文件')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='要测试的进程数')
+    parser.add_argument('--pages', type=int, default=None, help='只测试前N页')
+    parser.add_argument('--lang', type=str, default='chi_sim+eng', help='tesseract语言')
+    parser.add_argument('--dpi', type=int, default=200, help='渲染分辨率')
+    args = parser.parse_args()
+
+    check_ocr_available()
+
+    import fitz
+    with fitz.open(args.pdf) as doc:
+        total_pages = doc.page_count
+    pages = list(range(min(args.pages or total_pages, total_pages)))
+    print(f"📄 {args.pdf}: 测试 {len(pages)}/{total_pages} 页，dpi={args.dpi}, lang={args.lang}\n")
+
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            start = time.perf_counter()
+            ocr_pdf(args.pdf, pages=pages, lang=args.lang, dpi=args.dpi, max_workers=workers, cache_dir=cache_dir)
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            ocr_pdf(args.pdf, pages=pages, lang=args.lang, dpi=args.dpi, max_workers=workers, cache_dir=cache_dir)
+            warm = time.perf_counter() - start
+
+        print(f"⚙️ {workers} 进程: 冷缓存 {len(pages) / cold:.2f} 页/秒（{cold:.1f} 秒），"
+              f"热缓存 {len(pages) / warm:.1f} 页/秒")
+
+
+if __name__ == "__main__":
+    main()
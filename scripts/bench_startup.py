@@ -0,0 +1,109 @@
+"""
+启动耗时基准测试
+
+测量 CLI 与 Web 应用模块的冷启动时间，并检查重量级依赖是否被延迟导入，
+防止后续改动让启动时间回退。
+
+用法:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10 --max-ms 300
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+# 项目根目录（脚本位于 scripts/ 下）
+ROOT = Path(__file__).resolve().parent.parent
+
+# 各场景导入后不应出现在 sys.modules 中的模块
+CASES = {
+    "import paper_summarizer": (
+        "import paper_summarizer",
+        ["PyPDF2", "openai", "requests", "gradio"],
+    ),
+    "import app": (
+        "import app",
+        ["PyPDF2", "openai", "requests", "gradio"],
+    ),
+    "paper_summarizer.py --help": (
+        "import sys; sys.argv = ['paper_summarizer.py', '--help']\n"
+        "import paper_summarizer\n"
+        "try:\n"
+        "    paper_summarizer.main()\n"
+        "except SystemExit:\n"
+        "    pass",
+        ["PyPDF2", "openai", "requests", "gradio"],
+    ),
+    "Gemini原生路径初始化": (
+        "from paper_summarizer import PaperSummarizer\n"
+        "PaperSummarizer(api_key='x', base_url='http://localhost/v1', model='gemini-2.5-flash')",
+        ["PyPDF2", "openai"],
+    ),
+}
+
+
+def run_case(code: str, forbidden: list) -> dict:
+    """在全新解释器中运行一次，返回耗时和意外加载的模块"""
+    probe = (
+        f"{code}\n"
+        "import sys, json\n"
+        f"print('__LOADED__' + json.dumps([m for m in {forbidden!r} if m in sys.modules]))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+
+    loaded = []
+    for line in result.stdout.splitlines():
+        if line.startswith("__LOADED__"):
+            loaded = json.loads(line[len("__LOADED__"):])
+    return {"ms": elapsed_ms, "loaded": loaded}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='每个场景的运行次数')
+    parser.add_argument('--max-ms', type=float, default=None, help='中位耗时上限（毫秒），超出则返回非零退出码')
+    args = parser.parse_args()
+
+    # 解释器本身的启动耗时作为基线
+    baseline = statistics.median(run_case("pass", [])["ms"] for _ in range(args.runs))
+    print(f"解释器基线: {baseline:.1f} ms\n")
+
+    failed = False
+    for name, (code, forbidden) in CASES.items():
+        runs = [run_case(code, forbidden) for _ in range(args.runs)]
+        median_ms = statistics.median(r["ms"] for r in runs)
+        loaded = sorted({m for r in runs for m in r["loaded"]})
+
+        status = "✅"
+        if loaded:
+            status = "❌"
+            failed = True
+        if args.max_ms is not None and median_ms > args.max_ms:
+            status = "❌"
+            failed = True
+
+        print(f"{status} {name}: 中位 {median_ms:.1f} ms（去除基线 {median_ms - baseline:.1f} ms）")
+        if loaded:
+            print(f"   意外加载的模块: {', '.join(loaded)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Web应用并发压测
+
+通过 Gradio 客户端API模拟多个用户同时调用 /process_papers，后端指向本地模拟LLM
+（scripts/mock_llm.py），不产生API费用。运行期间定时采样 /metrics 接口和
+app.py / worker.py 进程的内存，用于确定 GRADIO_MAX_THREADS、SCHEDULER_WORKERS
+和 worker 进程数。
+
+用法:
+    # 1. 启动应用（另一个终端），LOAD_TEST_METRICS=1 开启 /metrics 接口
+    LOAD_TEST_METRICS=1 python app.py
+    # 2. 压测（自动在 8001 端口启动模拟LLM）
+    python scripts/load_test.py --users 20 --files-per-user 3 --pages 20
+    python scripts/load_test.py --users 40 --iterations 3 --latency 5 --json report.json
+
+依赖: pip install gradio_client
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 允许从项目根目录导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_llm import start_mock_server  # noqa: E402
+
+# 正文行，每页重复若干行以控制文件大小
+FILLER = "This synthetic paper exists only to exercise the summarization pipeline under load."
+
+
+def make_pdf(path: Path, title: str, pages: int, lines_per_page: int = 40):
+    """
+    生成一个最小的多页文本PDF（不依赖第三方库）
+
+    Args:
+        path: 输出路径
+        title: 标题（写入每页首行，保证每个文件内容不同，避免被去重）
+        pages: 页数
+        lines_per_page: 每页文本行数
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # 占位，页面对象生成后回填
+    page_ids = []
+    for page_num in range(pages):
+        lines = [f"{title} - page {page_num + 1}"] + [FILLER] * lines_per_page
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td {text}ET".encode('latin-1')
+        content_id = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset)
+    path.write_bytes(bytes(out))
+
+
+def percentile(values, p):
+    """简单的最近秩百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def process_rss_mb():
+    """app.py 和 worker.py 各进程的常驻内存（MB），读取 /proc，非Linux返回空字典"""
+    result = {}
+    proc = Path('/proc')
+    if not proc.exists():
+        return result
+    for pid_dir in proc.iterdir():
+        if not pid_dir.name.isdigit():
+            continue
+        try:
+            cmdline = (pid_dir / 'cmdline').read_bytes().replace(b'\0', b' ').decode(errors='ignore')
+            if 'app.py' not in cmdline and 'worker.py' not in cmdline:
+                continue
+            for line in (pid_dir / 'status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    name = 'worker' if 'worker.py' in cmdline else 'app'
+                    result[f"{name}:{pid_dir.name}"] = int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return result
+
+
+class MetricsSampler(threading.Thread):
+    """后台定时采样 /metrics 接口和进程内存"""
+
+    def __init__(self, client, interval: float):
+        super().__init__(name="metrics-sampler", daemon=True)
+        self.client = client
+        self.interval = interval
+        self.samples = []
+        self.rss = {}      # 进程 -> 内存采样列表
+        self.errors = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.samples.append(self.client.predict(api_name="/metrics"))
+            except Exception:
+                self.errors += 1
+            for name, rss in process_rss_mb().items():
+                self.rss.setdefault(name, []).append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_user(user_id: int, args, file_lists):
+    """
+    模拟单个用户：每个用户使用独立的客户端（独立会话），依次提交自己的批次
+
+    Returns:
+        每次请求的 (耗时秒数, 错误信息或None) 列表
+    """
+    from gradio_client import Client
+    try:
+        from gradio_client import handle_file
+    except ImportError:
+        from gradio_client import file as handle_file
+
+    client = Client(args.url, verbose=False)
+    results = []
+    for files in file_lists:
+        start = time.time()
+        error = None
+        try:
+            _, _, status = client.predict(
+                [handle_file(str(f)) for f in files],
+                args.provider,
+                f"load-test-key-{user_id}",
+                args.base_url,
+                args.model,
+                "",
+                False,
+                args.skip_references,
+                args.structured,
+                api_name="/process_papers"
+            )
+            if not status or '❌' in str(status):
+                error = str(status)
+        except Exception as e:
+            error = str(e)
+        results.append((time.time() - start, error))
+    return results
+
+
+def print_report(args, elapsed, latencies, errors, sampler):
+    """输出压测报告，并返回报告字典"""
+    total_files = args.users * args.iterations * args.files_per_user
+    report = {
+        'users': args.users,
+        'files_per_user': args.files_per_user,
+        'iterations': args.iterations,
+        'pages': args.pages,
+        'elapsed': elapsed,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_files_per_min': total_files / elapsed * 60 if elapsed else 0.0,
+        'latency': {f"p{p}": percentile(latencies, p) for p in (50, 90, 95, 99)},
+    }
+    report['latency']['max'] = max(latencies) if latencies else 0.0
+
+    print(f"\n{'='*60}")
+    print(f"📊 压测结果: {args.users} 用户 × {args.iterations} 轮 × {args.files_per_user} 篇（每篇 {args.pages} 页）")
+    print(f"{'='*60}")
+    print(f"总耗时: {elapsed:.1f} 秒，请求 {len(latencies)} 次，失败 {len(errors)} 次")
+    print(f"吞吐量: {report['throughput_files_per_min']:.1f} 篇/分钟")
+    print("请求耗时: " + "  ".join(f"{k}={v:.2f}s" for k, v in report['latency'].items()))
+    for error in errors[:5]:
+        print(f"   ❌ {error[:200]}")
+
+    samples = [s for s in sampler.samples if isinstance(s, dict)]
+    if samples:
+        # 队列模式（WORKER_MODE=queue）下论文由worker进程处理，app内的调度器不参与，只报告队列指标
+        queue_samples = [s['queue'] for s in samples if s.get('queue')]
+        if queue_samples:
+            report['queue'] = {
+                'pending_max': max(q['pending'] for q in queue_samples),
+                'busy_workers_max': max(q['busy_workers'] for q in queue_samples),
+                'wait_avg': queue_samples[-1]['wait_avg'],
+                'wait_max': queue_samples[-1]['wait_max'],
+            }
+            print(f"\n📥 任务队列（队列模式，app内调度器未使用）: 最大积压 {report['queue']['pending_max']}，"
+                  f"最多 {report['queue']['busy_workers_max']} 个worker同时处理，"
+                  f"排队等待 avg={report['queue']['wait_avg']:.2f}s max={report['queue']['wait_max']:.2f}s")
+        else:
+            busy = [s['scheduler']['busy'] for s in samples]
+            max_workers = samples[-1]['scheduler']['max_workers']
+            saturated = sum(1 for b in busy if b >= max_workers) / len(busy)
+            last = samples[-1]['scheduler']
+            report['scheduler'] = {
+                'max_workers': max_workers,
+                'busy_mean': statistics.mean(busy),
+                'busy_max': max(busy),
+                'saturated_ratio': saturated,
+                'queued_max': max(s['scheduler']['queued_total'] for s in samples),
+                'wait_p50': last['wait_p50'],
+                'wait_p95': last['wait_p95'],
+                'wait_max': last['wait_max'],
+            }
+            print(f"\n🧵 调度器: {max_workers} 线程，平均忙碌 {report['scheduler']['busy_mean']:.1f}，"
+                  f"峰值 {report['scheduler']['busy_max']}，满载时间占比 {saturated:.0%}，"
+                  f"最大排队 {report['scheduler']['queued_max']}")
+            print(f"   排队等待: p50={last['wait_p50']:.2f}s  p95={last['wait_p95']:.2f}s  max={last['wait_max']:.2f}s")
+
+        threads = [s['threads'] for s in samples]
+        print(f"   应用进程线程数: 峰值 {max(threads)}")
+    else:
+        print(f"\n⚠️  未采样到 /metrics（失败 {sampler.errors} 次），仅统计客户端耗时；"
+              f"请确认应用以 LOAD_TEST_METRICS=1 启动")
+
+    if sampler.rss:
+        report['memory_mb'] = {}
+        print("\n💾 进程内存 (RSS):")
+        for name, values in sorted(sampler.rss.items()):
+            report['memory_mb'][name] = {'start': values[0], 'max': max(values), 'end': values[-1]}
+            print(f"   {name:<16} 起始 {values[0]:.0f}MB  峰值 {max(values):.0f}MB  结束 {values[-1]:.0f}MB")
+    print(f"{'='*60}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Web应用并发压测')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:7860', help='应用地址')
+    parser.add_argument('--users', type=int, default=10, help='并发用户数')
+    parser.add_argument('--files-per-user', type=int, default=2, help='每次请求上传的PDF数')
+    parser.add_argument('--iterations', type=int, default=1, help='每个用户连续提交的请求数')
+    parser.add_argument('--pages', type=int, default=10, help='每个PDF的页数')
+    parser.add_argument('--provider', type=str, default='OpenAI', help='API提供商（OpenAI 或 Gemini）')
+    parser.add_argument('--model', type=str, default='mock-model', help='模型名称')
+    parser.add_argument('--base-url', type=str, default=None,
+                        help='LLM基础URL（默认使用自动启动的模拟后端）')
+    parser.add_argument('--mock-port', type=int, default=8001, help='模拟LLM端口')
+    parser.add_argument('--latency', type=float, default=2.0, help='模拟LLM平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.5, help='模拟LLM延迟标准差（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟LLM返回错误的比例')
+    parser.add_argument('--skip-references', action='store_true', help='启用跳过参考文献')
+    parser.add_argument('--structured', action='store_true', help='启用结构化输出')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='指标采样间隔（秒）')
+    parser.add_argument('--json', type=str, default=None, help='把报告写入JSON文件')
+    args = parser.parse_args()
+
+    try:
+        from gradio_client import Client
+    except ImportError:
+        print("❌ 需要安装 gradio_client: pip install gradio_client")
+        sys.exit(1)
+
+    mock_server = None
+    if args.base_url is None:
+        mock_server = start_mock_server(port=args.mock_port, latency=args.latency,
+                                        jitter=args.jitter, error_rate=args.error_rate)
+        # 应用与压测脚本在同一台机器时可直接访问；Docker中运行时请用 --base-url 指定宿主机地址
+        args.base_url = f"http://127.0.0.1:{args.mock_port}/v1"
+        print(f"🤖 模拟LLM后端: {args.base_url}（延迟 {args.latency}±{args.jitter} 秒）")
+
+    with tempfile.TemporaryDirectory(prefix="load_test_") as tmp_dir:
+        # 每个文件内容唯一，避免被内容去重和总结缓存命中
+        run_id = f"{os.getpid()}-{random.randint(0, 1 << 30)}"
+        plans = []
+        for user_id in range(args.users):
+            file_lists = []
+            for iteration in range(args.iterations):
+                files = []
+                for n in range(args.files_per_user):
+                    path = Path(tmp_dir) / f"u{user_id}_i{iteration}_f{n}.pdf"
+                    make_pdf(path, f"Load test {run_id} user {user_id} batch {iteration} file {n}", args.pages)
+                    files.append(path)
+                file_lists.append(files)
+            plans.append(file_lists)
+        size_kb = sum(f.stat().st_size for fl in plans for files in fl for f in files) / 1024
+        print(f"📄 已生成 {args.users * args.iterations * args.files_per_user} 个测试PDF（共 {size_kb:.0f} KB）")
+
+        sampler = MetricsSampler(Client(args.url, verbose=False), args.sample_interval)
+        sampler.start()
+
+        print(f"🚀 开始压测: {args.users} 个并发用户 -> {args.url}")
+        start = time.time()
+        latencies, errors = [], []
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            futures = [pool.submit(run_user, user_id, args, file_lists)
+                       for user_id, file_lists in enumerate(plans)]
+            for future in futures:
+                for latency, error in future.result():
+                    latencies.append(latency)
+                    if error:
+                        errors.append(error)
+        elapsed = time.time() - start
+        sampler.stop()
+
+    report = print_report(args, elapsed, latencies, errors, sampler)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 报告已保存: {args.json}")
+
+    if mock_server:
+        mock_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
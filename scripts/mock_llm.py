@@ -0,0 +1,156 @@
+"""
+本地模拟LLM后端（用于压测，不产生API费用）
+
+同时支持 OpenAI 格式（POST /v1/chat/completions）和
+Gemini 原生格式（POST /v1beta/models/<model>:generateContent），
+按设定的延迟返回固定的总结内容和token用量。
+
+用法:
+    python scripts/mock_llm.py --port 8001 --latency 2.0 --jitter 0.5
+    # 然后在应用中把 API基础URL 设为 http://127.0.0.1:8001/v1
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 允许从项目根目录导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from structured import SECTIONS  # noqa: E402
+
+MOCK_SUMMARY = """## 1. 论文基本信息
+- 标题：模拟论文（压测用）
+- 研究问题：模拟LLM后端返回的固定内容
+
+## 2. 研究背景与理论基础
+- 本内容由 scripts/mock_llm.py 生成，用于测试应用在并发用户下的表现
+
+## 3. 研究方法
+- 固定延迟 + 随机抖动
+
+## 4. 实证结果
+- 无
+
+## 5. 结论与启示
+- 无
+"""
+
+
+def mock_structured_summary() -> str:
+    """结构化模式下返回的JSON"""
+    return json.dumps({
+        section_key: {field_key: f"模拟内容：{field_title}" for field_key, field_title in fields}
+        for section_key, _, fields in SECTIONS
+    }, ensure_ascii=False)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """按OpenAI / Gemini格式返回模拟响应"""
+
+    latency = 1.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        # 压测时请求量大，不输出访问日志
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        prompt_tokens = max(1, length // 4)
+
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if random.random() < self.error_rate:
+            self._send_json(500, {"error": {"message": "mock error"}})
+            return
+
+        if self.path.endswith('/chat/completions'):
+            structured = 'response_format' in request
+            content = mock_structured_summary() if structured else MOCK_SUMMARY
+            completion_tokens = len(content) // 2
+            self._send_json(200, {
+                "id": "mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get('model', 'mock'),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            })
+        elif ':generateContent' in self.path:
+            structured = 'generationConfig' in request
+            content = mock_structured_summary() if structured else MOCK_SUMMARY
+            completion_tokens = len(content) // 2
+            self._send_json(200, {
+                "candidates": [{"content": {"parts": [{"text": content}], "role": "model"}}],
+                "usageMetadata": {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": completion_tokens,
+                    "totalTokenCount": prompt_tokens + completion_tokens
+                }
+            })
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 8001, latency: float = 1.0,
+                      jitter: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """
+    在后台线程中启动模拟后端
+
+    Returns:
+        服务器对象（调用 shutdown() 停止）
+    """
+    handler = type('ConfiguredMockLLMHandler', (MockLLMHandler,), {
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟LLM后端')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8001, help='监听端口')
+    parser.add_argument('--latency', type=float, default=1.0, help='平均响应延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的标准差（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500错误的比例')
+    args = parser.parse_args()
+
+    server = start_mock_server(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"🤖 模拟LLM后端已启动: http://{args.host}:{args.port}/v1（延迟 {args.latency}±{args.jitter} 秒）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, Iterator, List, Optional
+
+# 结构化总结的字段，与 PaperSummarizer.default_prompt 的五个部分一一对应
+# 格式: (章节键, 章节标题, [(字段键, 字段标题), ...])
+SECTIONS = [
+    ('basic_info', '1. 论文基本信息', [
+        ('title', '标题'),
+        ('authors', '作者'),
+        ('year', '年份'),
+        ('research_question', '研究问题/研究假设'),
+    ]),
+    ('background', '2. 研究背景与理论基础', [
+        ('motivation', '研究背景和动机'),
+        ('literature', '文献回顾与理论框架'),
+        ('contributions', '研究贡献和创新点'),
+    ]),
+    ('methodology', '3. 研究方法', [
+        ('data', '样本来源和数据说明'),
+        ('dependent_variables', '因变量'),
+        ('independent_variables', '自变量'),
+        ('control_variables', '控制变量'),
+        ('design', '研究设计和模型设定'),
+    ]),
+    ('results', '4. 实证结果', [
+        ('descriptive_statistics', '描述性统计'),
+        ('baseline_results', '基准回归结果'),
+        ('robustness', '稳健性检验'),
+        ('mechanism_heterogeneity', '机制分析或异质性分析'),
+    ]),
+    ('conclusion', '5. 结论与启示', [
+        ('findings', '主要研究发现'),
+        ('implications', '理论贡献和实践意义'),
+        ('policy', '政策建议'),
+        ('limitations', '研究局限性和未来研究方向'),
+    ]),
+]
+
+
+def build_schema() -> Dict:
+    """生成JSON Schema（满足OpenAI strict模式：所有字段必填、不允许额外字段）"""
+    properties = {}
+    for section_key, section_title, fields in SECTIONS:
+        properties[section_key] = {
+            'type': 'object',
+            'description': section_title,
+            'properties': {
+                field_key: {'type': 'string', 'description': field_title}
+                for field_key, field_title in fields
+            },
+            'required': [field_key for field_key, _ in fields],
+            'additionalProperties': False,
+        }
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': [section_key for section_key, _, _ in SECTIONS],
+        'additionalProperties': False,
+    }
+
+
+SUMMARY_SCHEMA = build_schema()
+
+
+def gemini_schema(schema: Dict) -> Dict:
+    """转换为Gemini responseSchema支持的子集（不支持 additionalProperties）"""
+    if isinstance(schema, dict):
+        return {key: gemini_schema(value) for key, value in schema.items() if key != 'additionalProperties'}
+    if isinstance(schema, list):
+        return [gemini_schema(item) for item in schema]
+    return schema
+
+
+def structured_instruction() -> str:
+    """追加到prompt末尾的JSON输出要求"""
+    lines = ["\n\n请严格按照以下JSON结构输出，不要输出JSON以外的任何内容；无法识别的字段填空字符串：", "{"]
+    for section_key, section_title, fields in SECTIONS:
+        field_text = ', '.join(f'"{field_key}": "{field_title}"' for field_key, field_title in fields)
+        lines.append(f'  "{section_key}": {{{field_text}}},  // {section_title}')
+    lines.append("}")
+    return '\n'.join(lines)
+
+
+def repair_json(text: str) -> Dict:
+    """
+    解析模型输出的JSON，并修复常见问题
+
+    处理 ```json 代码块、JSON前后的说明文字、尾随逗号，
+    缺失的字段补为空字符串，非字符串的字段值转为字符串。
+
+    Raises:
+        ValueError: 无法解析为JSON对象
+    """
+    text = text.strip()
+    fence = re.search(r'```(?:json)?\s*(.*?)```', text, re.DOTALL)
+    if fence:
+        text = fence.group(1).strip()
+
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        raise ValueError("输出中没有JSON对象")
+    text = text[start:end + 1]
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # 去掉尾随逗号和 // 注释后重试
+        cleaned = re.sub(r'//[^\n"]*\n', '\n', text)
+        cleaned = re.sub(r',\s*([}\]])', r'\1', cleaned)
+        try:
+            data = json.loads(cleaned)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON解析失败: {str(e)}")
+
+    if not isinstance(data, dict):
+        raise ValueError("JSON顶层不是对象")
+
+    repaired = {}
+    for section_key, _, fields in SECTIONS:
+        section = data.get(section_key)
+        if not isinstance(section, dict):
+            section = {}
+        repaired[section_key] = {}
+        for field_key, _ in fields:
+            value = section.get(field_key, '')
+            if isinstance(value, list):
+                value = '；'.join(str(item) for item in value)
+            elif value is None:
+                value = ''
+            elif not isinstance(value, str):
+                value = str(value)
+            repaired[section_key][field_key] = value.strip()
+    return repaired
+
+
+def validate_summary(data: Dict) -> List[str]:
+    """
+    校验结构化总结
+
+    Returns:
+        问题列表，为空表示通过
+    """
+    errors = []
+    for section_key, section_title, fields in SECTIONS:
+        section = data.get(section_key)
+        if not isinstance(section, dict):
+            errors.append(f"缺少章节 {section_key}（{section_title}）")
+            continue
+        if not any(section.get(field_key) for field_key, _ in fields):
+            errors.append(f"章节 {section_key}（{section_title}）内容为空")
+    return errors
+
+
+def render_markdown(data: Dict) -> str:
+    """把结构化总结渲染为与默认prompt相同结构的Markdown"""
+    lines = []
+    for section_key, section_title, fields in SECTIONS:
+        lines.append(f"## {section_title}")
+        section = data.get(section_key, {})
+        for field_key, field_title in fields:
+            value = section.get(field_key) or '未提及'
+            lines.append(f"- **{field_title}**: {value}")
+        lines.append("")
+    return '\n'.join(lines).strip()
+
+
+class SummaryStore:
+    """
+    结构化总结的紧凑存储（JSONL，每行一篇论文）
+
+    只追加写入；查询时逐行流式读取并可只取需要的字段，
+    数千篇论文的批量统计不需要解析Markdown。
+    """
+
+    def __init__(self, path: str = "data/summaries.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, file_name: str, model: str, summary: Dict, extra: Optional[Dict] = None):
+        """追加一条记录（单次write，多进程以追加模式写入同一文件也不会交错）"""
+        record = {
+            'file_name': file_name,
+            'model': model,
+            'created_at': time.time(),
+            **(extra or {}),
+            'summary': summary,
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def iter_records(self) -> Iterator[Dict]:
+        """逐条读取所有记录"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def query(self, fields: Optional[List[str]] = None, contains: Optional[Dict[str, str]] = None) -> Iterator[Dict]:
+        """
+        查询记录
+
+        Args:
+            fields: 要返回的字段路径，如 ["file_name", "methodology.data"]，None表示整条记录
+            contains: 过滤条件 {字段路径: 子串}，所有条件都满足的记录才返回
+
+        Returns:
+            记录迭代器
+        """
+        for record in self.iter_records():
+            if contains and not all(
+                substring in str(_get_path(record, path) or '') for path, substring in contains.items()
+            ):
+                continue
+            if fields:
+                yield {path: _get_path(record, path) for path in fields}
+            else:
+                yield record
+
+
+def _get_path(record: Dict, path: str):
+    """按点号路径取值；章节字段可省略 summary 前缀（如 methodology.data）"""
+    value = record
+    keys = path.split('.')
+    if keys[0] not in record and 'summary' in record:
+        value = record['summary']
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def main():
+    """命令行查询结构化总结"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查询结构化论文总结')
+    parser.add_argument('--store', type=str, default='data/summaries.jsonl', help='JSONL存储文件')
+    parser.add_argument('--fields', type=str, nargs='+', help='要输出的字段，如 file_name methodology.data')
+    parser.add_argument('--where', type=str, nargs='+', default=[], help='过滤条件，如 basic_info.year=2023')
+    args = parser.parse_args()
+
+    contains = {}
+    for condition in args.where:
+        path, _, substring = condition.partition('=')
+        contains[path] = substring
+
+    count = 0
+    for record in SummaryStore(args.store).query(args.fields, contains):
+        print(json.dumps(record, ensure_ascii=False))
+        count += 1
+    print(f"共 {count} 条记录")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import json
+import time
+import threading
+from typing import Dict, Optional
+
+# 参考价格（美元 / 百万token，[输入, 输出]），按模型名前缀匹配，最长前缀优先
+# 价格会变动，仅用于估算；可通过 --price-table 或 PRICE_TABLE 环境变量指定JSON文件覆盖
+DEFAULT_PRICE_TABLE = {
+    'gpt-4o-mini': [0.15, 0.60],
+    'gpt-4o': [2.50, 10.00],
+    'gpt-4-turbo': [10.00, 30.00],
+    'gpt-4': [30.00, 60.00],
+    'gpt-3.5-turbo': [0.50, 1.50],
+    'gemini-2.5-pro': [1.25, 10.00],
+    'gemini-2.5-flash': [0.30, 2.50],
+    'gemini-2.0-flash': [0.10, 0.40],
+    'gemini-1.5-pro': [1.25, 5.00],
+    'gemini-1.5-flash': [0.075, 0.30],
+    'claude-3-opus': [15.00, 75.00],
+    'claude-3-sonnet': [3.00, 15.00],
+    'claude-3-haiku': [0.25, 1.25],
+}
+
+# Gemini按页计费：每页PDF约258个token
+GEMINI_TOKENS_PER_PDF_PAGE = 258
+
+
+class BudgetExceeded(Exception):
+    """批次预算已用完"""
+
+
+def load_price_table(path: Optional[str] = None) -> Dict:
+    """加载价格表，指定文件中的条目覆盖默认值"""
+    table = dict(DEFAULT_PRICE_TABLE)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            table.update(json.load(f))
+    return table
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数
+
+    英文约4个字符一个token，中文等非ASCII字符约一个字符一个token。
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+class UsageTracker:
+    """
+    线程安全的token用量、费用和吞吐量统计，可选按预算降级模型或停止
+
+    预算在每次API调用前检查，已经发出的并发请求不会被中断，因此实际用量可能略超预算。
+    """
+
+    def __init__(self, price_table: Optional[Dict] = None, max_tokens: Optional[int] = None,
+                 max_cost: Optional[float] = None, fallback_model: Optional[str] = None,
+                 downgrade_at: float = 0.8):
+        """
+        初始化用量统计
+
+        Args:
+            price_table: 价格表（美元 / 百万token），默认使用 DEFAULT_PRICE_TABLE
+            max_tokens: 批次token上限（输入+输出）
+            max_cost: 批次费用上限（美元）
+            fallback_model: 用量达到 downgrade_at 比例后切换到的便宜模型
+            downgrade_at: 触发降级的预算比例
+        """
+        self.price_table = price_table or DEFAULT_PRICE_TABLE
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.fallback_model = fallback_model
+        self.downgrade_at = downgrade_at
+
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.calls = []
+
+    def price(self, model: str) -> Optional[list]:
+        """查找模型价格，未知模型返回None"""
+        model = model.lower()
+        matches = [prefix for prefix in self.price_table if model.startswith(prefix.lower())]
+        if not matches:
+            return None
+        return self.price_table[max(matches, key=len)]
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        """计算费用（美元），未知模型返回None"""
+        price = self.price(model)
+        if price is None:
+            return None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int,
+               elapsed: float = 0.0, label: Optional[str] = None) -> Dict:
+        """
+        记录一次API调用
+
+        Returns:
+            本次调用的用量字典
+        """
+        entry = {
+            'label': label,
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'cost': self.cost(model, prompt_tokens, completion_tokens),
+            'elapsed': elapsed,
+        }
+        with self._lock:
+            self.calls.append(entry)
+        return entry
+
+    def totals(self) -> Dict:
+        """汇总用量（总计和按模型）"""
+        with self._lock:
+            calls = list(self.calls)
+
+        by_model = {}
+        for call in calls:
+            stats = by_model.setdefault(call['model'], {
+                'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'cost': 0.0
+            })
+            stats['calls'] += 1
+            stats['prompt_tokens'] += call['prompt_tokens']
+            stats['completion_tokens'] += call['completion_tokens']
+            stats['total_tokens'] += call['total_tokens']
+            if call['cost'] is None:
+                stats['cost'] = None
+            elif stats['cost'] is not None:
+                stats['cost'] += call['cost']
+
+        wall_time = time.time() - self.started_at
+        total_tokens = sum(call['total_tokens'] for call in calls)
+        costs = [stats['cost'] for stats in by_model.values()]
+        return {
+            'calls': len(calls),
+            'prompt_tokens': sum(call['prompt_tokens'] for call in calls),
+            'completion_tokens': sum(call['completion_tokens'] for call in calls),
+            'total_tokens': total_tokens,
+            'cost': None if None in costs else sum(costs),
+            'wall_time': wall_time,
+            'papers_per_minute': len(calls) / wall_time * 60 if wall_time > 0 else 0.0,
+            'tokens_per_second': total_tokens / wall_time if wall_time > 0 else 0.0,
+            'by_model': by_model,
+        }
+
+    def _budget_fraction(self, totals: Dict) -> float:
+        """已用预算比例（token和费用中较大的一个）"""
+        fractions = [0.0]
+        if self.max_tokens:
+            fractions.append(totals['total_tokens'] / self.max_tokens)
+        if self.max_cost and totals['cost'] is not None:
+            fractions.append(totals['cost'] / self.max_cost)
+        return max(fractions)
+
+    def select_model(self, model: str) -> str:
+        """
+        在API调用前检查预算
+
+        Args:
+            model: 当前要使用的模型
+
+        Returns:
+            实际应使用的模型（可能降级为 fallback_model）
+
+        Raises:
+            BudgetExceeded: 预算已用完
+        """
+        if not (self.max_tokens or self.max_cost):
+            return model
+
+        totals = self.totals()
+        fraction = self._budget_fraction(totals)
+        if fraction >= 1.0:
+            raise BudgetExceeded(
+                f"批次预算已用完（已用 {totals['total_tokens']} tokens" +
+                (f"，约 ${totals['cost']:.4f}" if totals['cost'] is not None else "") + "）"
+            )
+        if self.fallback_model and fraction >= self.downgrade_at:
+            return self.fallback_model
+        return model
+
+    def format_markdown(self) -> str:
+        """生成Markdown格式的用量统计"""
+        totals = self.totals()
+        lines = ["## 📊 用量统计\n"]
+        lines.append(f"- **API调用次数**: {totals['calls']}")
+        lines.append(f"- **Token总数**: {totals['total_tokens']}"
+                     f"（输入 {totals['prompt_tokens']} / 输出 {totals['completion_tokens']}）")
+        if totals['cost'] is not None:
+            lines.append(f"- **估算费用**: ${totals['cost']:.4f}")
+        else:
+            lines.append("- **估算费用**: 未知（价格表中没有该模型）")
+        lines.append(f"- **吞吐量**: {totals['papers_per_minute']:.2f} 篇/分钟，"
+                     f"{totals['tokens_per_second']:.1f} tokens/秒")
+
+        if len(totals['by_model']) > 1:
+            lines.append("\n| 模型 | 调用 | 输入tokens | 输出tokens | 费用 |")
+            lines.append("|------|------|-----------|-----------|------|")
+            for model, stats in totals['by_model'].items():
+                cost = f"${stats['cost']:.4f}" if stats['cost'] is not None else "未知"
+                lines.append(f"| {model} | {stats['calls']} | {stats['prompt_tokens']} | "
+                             f"{stats['completion_tokens']} | {cost} |")
+
+        return '\n'.join(lines) + '\n\n'
+
+    def write_log(self, path: str, extra: Optional[Dict] = None):
+        """把本批次的汇总追加到JSONL指标文件"""
+        record = {'timestamp': time.time(), **(extra or {}), **self.totals()}
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def format_usage_line(usage: Optional[Dict]) -> str:
+    """单篇论文的用量说明"""
+    if not usage:
+        return ""
+    line = f"**Token用量**: 输入 {usage['prompt_tokens']} / 输出 {usage['completion_tokens']}（{usage['model']}）"
+    if usage.get('cost') is not None:
+        line += f"，约 ${usage['cost']:.4f}"
+    return line + "\n\n"
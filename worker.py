@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import socket
+import threading
+from typing import Dict
+from job_store import JobStore
+from blob_store import hash_file
+from paper_summarizer import PaperSummarizer
+
+
+def process_job(store: JobStore, job: Dict):
+    """
+    处理单个任务：先查共享缓存，未命中再调用API
+
+    Args:
+        store: 任务存储
+        job: claim_next 返回的任务字典
+    """
+    settings = job['settings']
+    prompt = settings.get('prompt') or None
+
+    try:
+        skip_references = bool(settings.get('skip_references'))
+        structured = bool(settings.get('structured'))
+        content_hash = job.get('content_hash') or hash_file(job['file_path'])
+        cache_key = store.cache_key(content_hash, settings['model'], prompt,
+                                    {'skip_references': skip_references, 'structured': structured})
+        summary = store.get_cached(cache_key)
+        usage = None
+        if summary is not None:
+            print(f"♻️ 命中缓存: {job['file_name']}")
+        else:
+            summarizer = PaperSummarizer(
+                api_key=settings['api_key'],
+                base_url=settings.get('base_url') or None,
+                model=settings['model'],
+                skip_references=skip_references,
+                ocr_fallback=os.getenv('OCR_FALLBACK', '0') == '1',
+                structured=structured
+            )
+            summary_data = summarizer.summarize_paper(job['file_path'], prompt, job['file_name'])
+            usage = summary_data.get('usage')
+            if structured:
+                # 结构化结果以JSON返回，由app渲染Markdown
+                summary = json.dumps(summary_data['structured'], ensure_ascii=False)
+            else:
+                summary = summary_data['summary']
+
+            # 验证总结内容
+            if not summary or len(summary.strip()) < 50:
+                raise Exception("生成的总结内容为空或太短")
+
+            store.put_cached(cache_key, summary)
+
+        store.complete(job['id'], summary, usage)
+        print(f"✅ {job['file_name']} 处理成功")
+
+    except Exception as e:
+        store.fail(job['id'], str(e))
+        print(f"❌ {job['file_name']} 处理失败: {str(e)}")
+
+
+def _heartbeat_loop(store: JobStore, job_id: str, interval: float, stop: threading.Event):
+    """任务处理期间定时更新心跳，直到 stop 被设置"""
+    while not stop.wait(interval):
+        try:
+            store.heartbeat(job_id)
+        except Exception as e:
+            print(f"⚠️ 心跳更新失败: {str(e)}")
+
+
+def run_worker(data_dir: str = "data", poll_interval: float = 1.0, stale_timeout: float = 900, once: bool = False):
+    """
+    worker主循环：从共享队列领取任务直到被中断
+
+    Args:
+        data_dir: 共享数据目录
+        poll_interval: 队列为空时的轮询间隔（秒）
+        stale_timeout: 任务超过该秒数没有心跳视为worker失联并重新入队（处理期间每 stale_timeout/3 秒更新一次心跳）
+        once: 队列为空时立即退出（用于批量脚本）
+    """
+    store = JobStore(data_dir)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    print(f"👷 worker {worker_id} 已启动，数据目录: {data_dir}")
+
+    while True:
+        requeued = store.requeue_stale(stale_timeout)
+        if requeued:
+            print(f"🔁 重新入队 {requeued} 个超时任务")
+
+        job = store.claim_next(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"\n📄 [{worker_id}] 正在处理: {job['file_name']}")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat_loop, args=(store, job['id'], stale_timeout / 3, stop),
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            process_job(store, job)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+
+def main():
+    """命令行启动worker"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='论文总结队列worker')
+    parser.add_argument('--data-dir', type=str, default=os.getenv('DATA_DIR', 'data'), help='共享数据目录')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='队列为空时的轮询间隔（秒）')
+    parser.add_argument('--stale-timeout', type=float, default=900, help='任务超过该秒数没有心跳时重新入队')
+    parser.add_argument('--once', action='store_true', help='队列清空后退出')
+    args = parser.parse_args()
+
+    try:
+        run_worker(args.data_dir, args.poll_interval, args.stale_timeout, args.once)
+    except KeyboardInterrupt:
+        print("worker已停止")
+
+
+if __name__ == "__main__":
+    main()